@@ -1,25 +1,50 @@
-from fastapi import FastAPI, HTTPException, Depends, Query
-from typing import Annotated, List, Optional
+from contextlib import asynccontextmanager
+from datetime import datetime
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response
+from typing import Annotated, List, Literal, Optional
 
-from sqlalchemy.orm import Session
-from data.database import SessionLocal, engine, User, Watchlist, Shop, watchlist_products
-from sqlalchemy.sql import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from data.database import AsyncSessionLocal, User, Watchlist, Shop, watchlist_products
+from sqlalchemy.sql import delete, select
 
 
 from fastapi.middleware.cors import CORSMiddleware
 
-from data.database import Base
+from data.database import engines_pool_status
 from models.user import UserCreate, UserRead, LoginSchema
-from models.watchlist import WatchlistCreateRequest
-from models.product import SearchResponse
+from models.watchlist import WatchlistCreateRequest, WatchlistProductsChangeRequest, WatchlistProductsChangeResponse
+from models.product import BatchSearchRequest, BatchSearchResponse, ProductHistoryPoints, SearchResponse
 from models.shop import ShopRead
+from models.alert import PriceAlertsResponse
 
+import scripts.auth as auth
 import scripts.helper as helper
+import scripts.fast_json as fast_json
+import scripts.http_cache as http_cache
+from scripts.search_cache import search_cache
+from scripts.search_index import SEARCH_BACKEND, search_index
+from scripts.password_pool import password_pool
+from scripts.suggest import suggest_service
+from scripts.watchlist_cache import watchlist_cache
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    auth.check_configuration()
+    async with AsyncSessionLocal() as db:
+        await search_cache.refresh_shop_versions_async(db)
+        # Build the in-memory search index before serving, later ingests are picked up incrementally
+        if SEARCH_BACKEND == "memory":
+            await search_index.refresh_async(db, search_cache.shop_versions())
+    # suggestions build in the background, /products/suggest returns [] until ready
+    suggest_service.ensure_fresh(AsyncSessionLocal, search_cache.shop_versions())
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 
 # To allow communication to front end url
 app.add_middleware(
@@ -31,17 +56,15 @@ app.add_middleware(
 
 
 # Connection to database
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()  # This ensures proper clean up and dont need to manually db.close() every query
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db  # session is closed on exit, dont need to manually db.close() every query
 
 
-db_dependency = Annotated[Session, Depends(get_db)]
-
-Base.metadata.create_all(bind=engine)
+db_dependency = Annotated[AsyncSession, Depends(get_db)]
+# /users/{user_id}/... routes: a bearer token from /login, if sent (or REQUIRE_AUTH), must be this user's.
+# The claims are None without a token, otherwise the user is known to exist without a lookup.
+token_dependency = Annotated[dict | None, Depends(auth.authorize_user)]
 
 
 @app.get("/")
@@ -52,143 +75,330 @@ def ello():
 @app.post("/users", response_model=UserRead)
 async def create_user(user: UserCreate, db: db_dependency):
     try:
-        existing_user = get_user_by_email(db, user.email)
+        existing_user = await get_user_by_email(db, user.email)
         if existing_user:
             raise HTTPException(status_code=409, detail="Email already registered")
-        user.password = helper.hash_password(user.password)
+        user.password = await password_pool.hash_password(user.password)
         db_user = User(**user.model_dump())
         db.add(db_user)
-        db.flush()
+        await db.flush()
 
-        helper.create_watchlist_for_user(db_user.id, "Favourites", db)  # type: ignore
-        db.refresh(db_user)
+        await helper.create_watchlist_for_user_async(db_user.id, "Favourites", db)  # type: ignore
+        await db.refresh(db_user)
         return UserRead.model_validate(db_user)
+    except HTTPException:
+        await db.rollback()
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
 @app.get("/users", response_model=list[UserRead])
 async def read_user(db: db_dependency, skip: int = 0, limit: int = 100):
-    users = db.query(User).offset(skip).limit(limit).all()
+    users = (await db.execute(select(User).offset(skip).limit(limit))).scalars().all()
     return [UserRead.model_validate(user) for user in users]
 
 
 @app.delete("/users/{user_id}", status_code=204)
-def delete_user(user_id: int, db: db_dependency):
+async def delete_user(user_id: int, token: token_dependency, db: db_dependency):
     # search user by id
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:  # throw error if user not found in database
         raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found.")
-    db.delete(user)
-    db.commit()
+    await db.delete(user)
+    await db.commit()
+    auth.deny_list.revoke_user(user_id)
     return {"message": "User {user.user_id} deleted successfully"}
 
 
-def get_user_by_email(db: Session, email: str) -> User | None:
-    user = db.query(User).filter(User.email == email).first()
+async def get_user_by_email(db: AsyncSession, email: str) -> User | None:
+    user = (await db.execute(select(User).where(User.email == email))).scalar_one_or_none()
     return user
 
 
 @app.get("/users/{email}", response_model=UserRead)
 async def read_user_by_email(email: str, db: db_dependency):
-    user = get_user_by_email(db=db, email=email)
+    user = await get_user_by_email(db=db, email=email)
     return user  # Return user if found, else return None
 
 
 @app.get("/shops", response_model=list[ShopRead])
-async def get_shops(db: db_dependency):
-    shops = db.query(Shop).all()
-    return shops
+async def get_shops(request: Request, response: Response, db: db_dependency):
+    await search_cache.refresh_shop_versions_async(db)
+    etag = http_cache.shop_data_etag(search_cache.shop_versions(), None)
+    if http_cache.etag_matches(request, etag):
+        return http_cache.not_modified(etag, http_cache.SHOPS_CACHE_CONTROL)
+
+    shops = (await db.execute(select(Shop))).scalars().all()
+    return http_cache.with_cache_headers(shops, response, etag, http_cache.SHOPS_CACHE_CONTROL)
 
 
 @app.get("/products/search", response_model=SearchResponse)
 async def search_products(
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: db_dependency,
     user_input: Optional[str] = Query(None, description="Search term for product name"),
     shop_ids: Optional[List[int]] = Query(None),
     limit: int = Query(20, ge=1, le=40),
     offset: int = Query(0, ge=0),
+    mode: Literal["substring", "fuzzy"] = Query("substring", description="fuzzy: typo tolerant, ranked by similarity"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page, replaces offset"),
+    user_id: Optional[int] = Query(None, description="Adds watchlist_ids (this user's watchlists) to every product"),
+    token: Annotated[dict | None, Depends(auth.authorize_optional_user)] = None,  # user_id is checked like /users/..
 ):
+    # results only change with the searched shops' data, answer revalidations without searching.
+    # With user_id they also change with the user's watchlists: no shared caching, no extra version lookup
+    await search_cache.refresh_shop_versions_async(db)
+    etag = http_cache.shop_data_etag(search_cache.shop_versions(), shop_ids or [], request.url.query)
+    if user_id is None and http_cache.etag_matches(request, etag):
+        return http_cache.not_modified(etag, http_cache.SEARCH_CACHE_CONTROL)
+
+    products, has_more, next_cursor = await helper.search_for_product_async(
+        db, user_input, shop_ids, limit, offset, mode, cursor, user_id
+    )
+    if fast_json.FAST_JSON:
+        result = fast_json.FastJSONResponse(fast_json.search_response(products, has_more, next_cursor))
+    else:
+        result = {
+            "products": products,
+            "has_more": has_more,
+            "next_cursor": next_cursor,
+        }
+    if user_id is not None:
+        return http_cache.without_caching(result, response)
+    return http_cache.with_cache_headers(result, response, etag, http_cache.SEARCH_CACHE_CONTROL)
+
+
+@app.post("/products/search/batch", response_model=BatchSearchResponse)
+async def search_products_batch(request: BatchSearchRequest, db: db_dependency):
+    """Search a whole shopping list at once, top `limit` products per line, one database round trip"""
+    results = await helper.search_products_batch_async(db, request.queries, request.shop_ids, request.limit, request.mode)
+    if fast_json.FAST_JSON:
+        return fast_json.FastJSONResponse(fast_json.batch_search_response(results))
+    return {"results": results}
+
+
+@app.get("/products/{product_id}/compare")
+async def compare_product(product_id: int, db: db_dependency):
+    """Same product in every shop with its latest price, cheapest first"""
+    return fast_json.respond(await helper.fetch_product_comparison_async(product_id, db))
+
+
+@app.get("/products/{product_id}/history", response_model=ProductHistoryPoints)
+async def get_product_history(
+    product_id: int,
+    db: db_dependency,
+    date_from: Optional[datetime] = Query(None, alias="from", description="Defaults to `points` buckets before `to`"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    bucket: Literal["day", "week", "month"] = Query("day"),
+    points: int = Query(365, ge=1, le=helper.HISTORY_MAX_POINTS, description="Max buckets returned, newest kept"),
+):
+    """Price history aggregated per bucket (min/max/last price), for the app's charts"""
+    return fast_json.respond(
+        await helper.fetch_product_history_async(product_id, db, bucket, date_from, date_to, points)
+    )
 
-    products, has_more = helper.search_for_product(db, user_input, shop_ids, limit, offset)
-    return {
-        "products": products,
-        "has_more": has_more,
-    }
+
+@app.get("/products/suggest")
+async def suggest_products(
+    db: db_dependency,
+    prefix: str = Query(..., min_length=1, max_length=100, description="What the user typed so far"),
+    limit: int = Query(8, ge=1, le=20),
+):
+    """Autocomplete from an in-memory prefix structure, rebuilt in the background after each ingest"""
+    await search_cache.refresh_shop_versions_async(db)
+    suggest_service.ensure_fresh(AsyncSessionLocal, search_cache.shop_versions())
+
+    normalized_prefix = helper.normalize_name(prefix)
+    if prefix.endswith(" "):
+        normalized_prefix += " "  # finished word, suggest what follows it
+    return {"prefix": prefix, "suggestions": suggest_service.suggest(normalized_prefix, limit)}
+
+
+@app.get("/metrics/search-cache")
+async def search_cache_stats():
+    """Hit/miss counters of the in-process search result cache (per worker)"""
+    return search_cache.stats()
+
+
+@app.get("/metrics/pool")
+async def pool_stats():
+    """Connection pool occupancy and checkout wait times (per worker), to tell pool waits from slow queries"""
+    return engines_pool_status()
+
+
+@app.get("/metrics/watchlist-cache")
+async def watchlist_cache_stats():
+    """Hit/miss and write-through counters of the watchlist summary cache (per worker)"""
+    return watchlist_cache.stats()
+
+
+@app.get("/metrics/passwords")
+async def password_pool_stats():
+    """bcrypt pool occupancy and shed (503) count (per worker)"""
+    return password_pool.stats()
+
+
+@app.get("/metrics/search-index")
+async def search_index_stats():
+    """Size of the in-memory search index (SEARCH_BACKEND=memory, per worker)"""
+    return search_index.stats()
+
+
+async def watchlist_etag(request: Request, db: AsyncSession, user_id: int, with_prices: bool) -> tuple[str, int]:
+    """
+    Watchlist responses change with the user's edits, and with ingests when they include prices
+    Returns:
+        tuple(str, int): (etag, users.watchlists_version)
+    """
+    watchlists_version = await helper.get_watchlists_version_async(user_id, db)
+    if with_prices:
+        await search_cache.refresh_shop_versions_async(db)
+        etag = http_cache.shop_data_etag(search_cache.shop_versions(), None, user_id, watchlists_version, request.url)
+    else:
+        etag = http_cache.make_etag(user_id, watchlists_version, request.url)
+    return etag, watchlists_version
 
 
 @app.get("/users/{user_id}/watchlists")
-async def get_watchlists(user_id: int, db: Session = Depends(get_db)):
-    watchlists_list = helper.fetch_user_watchlists_with_prices(user_id, db)
-    return {"user_id": user_id, "watchlists": watchlists_list}
+async def get_watchlists(
+    user_id: int, token: token_dependency, request: Request, response: Response, db: db_dependency
+):
+    etag, _ = await watchlist_etag(request, db, user_id, with_prices=True)
+    if http_cache.etag_matches(request, etag):
+        return http_cache.not_modified(etag, http_cache.WATCHLIST_CACHE_CONTROL)
+
+    # the version lookup above already 404s for an unknown user
+    watchlists_list = await helper.fetch_user_watchlists_with_prices_async(user_id, db, user_verified=True)
+    result = fast_json.respond({"user_id": user_id, "watchlists": watchlists_list})
+    return http_cache.with_cache_headers(result, response, etag, http_cache.WATCHLIST_CACHE_CONTROL)
 
 
 @app.post("/users/{user_id}/watchlist")
-async def create_watchlist(user_id: int, request: WatchlistCreateRequest, db: db_dependency):
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    new_watchlist = helper.create_watchlist_for_user(user_id, request.watchlist_name, db)
+async def create_watchlist(user_id: int, token: token_dependency, request: WatchlistCreateRequest, db: db_dependency):
+    if token is None:
+        user = await db.get(User, user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+    new_watchlist = await helper.create_watchlist_for_user_async(user_id, request.watchlist_name, db)
 
     return {"watchlist": new_watchlist}
 
 
 @app.get("/users/{user_id}/watchlists/summary")
-async def get_user_watchlists_summary(user_id: int, db: Session = Depends(get_db)):
+async def get_user_watchlists_summary(
+    user_id: int, token: token_dependency, request: Request, response: Response, db: db_dependency
+):
     """Get basic watchlist info + product membership mapping for search page"""
-    watchlists_summary = helper.fetch_user_watchlists_summary(user_id, db)
-    return {"user_id": user_id, "watchlists": watchlists_summary}
+    etag, watchlists_version = await watchlist_etag(request, db, user_id, with_prices=False)
+    if http_cache.etag_matches(request, etag):
+        return http_cache.not_modified(etag, http_cache.WATCHLIST_CACHE_CONTROL)
+
+    watchlists_summary = await helper.fetch_user_watchlists_summary_async(user_id, db, watchlists_version)
+    result = fast_json.respond({"user_id": user_id, "watchlists": watchlists_summary})
+    return http_cache.with_cache_headers(result, response, etag, http_cache.WATCHLIST_CACHE_CONTROL)
 
 
 @app.get("/users/{user_id}/watchlist/{watchlist_id}")
 async def get_user_watchlist_products(
     user_id: int,
     watchlist_id: int,
+    token: token_dependency,
+    request: Request,
+    response: Response,
     db: db_dependency,
     limit: int = Query(20, ge=1, le=50),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page, replaces offset"),
 ):
     """Get full product details for a specific watchlist (for watchlist details page)"""
-    (watchlist, products, has_more) = helper.fetch_user_watchlist_products(user_id, watchlist_id, db, limit, offset)
-    return {"id": watchlist.id, "name": watchlist.name, "products": products, "has_more": has_more}
+    etag, _ = await watchlist_etag(request, db, user_id, with_prices=True)
+    if http_cache.etag_matches(request, etag):
+        return http_cache.not_modified(etag, http_cache.WATCHLIST_CACHE_CONTROL)
+
+    (watchlist, products, has_more, next_cursor) = await helper.fetch_user_watchlist_products_async(
+        user_id, watchlist_id, db, limit, offset, cursor
+    )
+    result = fast_json.respond(
+        {
+            "id": watchlist.id,
+            "name": watchlist.name,
+            "products": products,
+            "has_more": has_more,
+            "next_cursor": next_cursor,
+        }
+    )
+    return http_cache.with_cache_headers(result, response, etag, http_cache.WATCHLIST_CACHE_CONTROL)
+
+
+async def get_owned_watchlist(db: AsyncSession, user_id: int, watchlist_id: int) -> Watchlist | None:
+    return (
+        await db.execute(select(Watchlist).where(Watchlist.id == watchlist_id, Watchlist.user_id == user_id))
+    ).scalar_one_or_none()
 
 
 @app.post("/users/{user_id}/watchlist/{watchlist_id}/product/{product_id}")
-async def add_to_watchlist(user_id: int, watchlist_id: int, product_id: int, db: db_dependency):
+async def add_to_watchlist(
+    user_id: int, watchlist_id: int, product_id: int, token: token_dependency, db: db_dependency
+):
     # Verify watchlist ownership
-    watchlist = db.query(Watchlist).filter(Watchlist.id == watchlist_id, Watchlist.user_id == user_id).first()
+    watchlist = await get_owned_watchlist(db, user_id, watchlist_id)
     if not watchlist:
         raise HTTPException(status_code=404, detail="Watchlist not found")
 
-    # Check if already exists
-    existing = db.execute(
-        select(watchlist_products).where(
-            watchlist_products.c.watchlist_id == watchlist_id, watchlist_products.c.product_id == product_id
-        )
-    ).fetchone()
-
-    if existing:
+    # Add to watchlist (ON CONFLICT, no separate existence check)
+    outcome = (await helper.add_watchlist_products_async(watchlist_id, [product_id], db))[product_id]
+    if outcome == "already_in_watchlist":
         raise HTTPException(status_code=400, detail="Product already in watchlist")
+    if outcome == "product_not_found":
+        raise HTTPException(status_code=404, detail="Product not found")
 
-    # Add to watchlist
-    db.execute(watchlist_products.insert().values(watchlist_id=watchlist_id, product_id=product_id))
-    db.commit()
+    watchlists_version = await helper.bump_watchlists_version_async(user_id, db)
+    await db.commit()
+    await watchlist_cache.change_products(user_id, watchlists_version, watchlist_id, added=[product_id])
 
     return {"message": "Product added to watchlist", "watchlist_id": watchlist_id}
 
 
-@app.delete("/users/{user_id}/watchlist/{watchlist_id}/product/{product_id}")
-async def remove_from_watchlist(user_id: int, watchlist_id: int, product_id: int, db: db_dependency):
-    from sqlalchemy import delete
+@app.post("/users/{user_id}/watchlist/{watchlist_id}/products", response_model=WatchlistProductsChangeResponse)
+async def change_watchlist_products(
+    user_id: int, watchlist_id: int, token: token_dependency, request: WatchlistProductsChangeRequest, db: db_dependency
+):
+    """Add and remove many products at once: one ownership check, one statement per direction, one commit"""
+    watchlist = await get_owned_watchlist(db, user_id, watchlist_id)
+    if not watchlist:
+        raise HTTPException(status_code=404, detail="Watchlist not found")
+
+    added = await helper.add_watchlist_products_async(watchlist_id, request.add, db)
+    removed = await helper.remove_watchlist_products_async(watchlist_id, request.remove, db)
+    added_ids = [product_id for product_id, outcome in added.items() if outcome == "added"]
+    removed_ids = [product_id for product_id, outcome in removed.items() if outcome == "removed"]
+
+    if added_ids or removed_ids:
+        watchlists_version = await helper.bump_watchlists_version_async(user_id, db)
+        await db.commit()
+        await watchlist_cache.change_products(
+            user_id, watchlists_version, watchlist_id, added=added_ids, removed=removed_ids
+        )
+    else:
+        await db.rollback()
 
+    return {"watchlist_id": watchlist_id, "added": added, "removed": removed}
+
+
+@app.delete("/users/{user_id}/watchlist/{watchlist_id}/product/{product_id}")
+async def remove_from_watchlist(
+    user_id: int, watchlist_id: int, product_id: int, token: token_dependency, db: db_dependency
+):
     # Verify watchlist ownership
-    watchlist = db.query(Watchlist).filter(Watchlist.id == watchlist_id, Watchlist.user_id == user_id).first()
+    watchlist = await get_owned_watchlist(db, user_id, watchlist_id)
     if not watchlist:
         raise HTTPException(status_code=404, detail="Watchlist not found")
 
     # Remove from watchlist
-    result = db.execute(
+    result = await db.execute(
         delete(watchlist_products).where(
             watchlist_products.c.watchlist_id == watchlist_id, watchlist_products.c.product_id == product_id
         )
@@ -197,29 +407,53 @@ async def remove_from_watchlist(user_id: int, watchlist_id: int, product_id: int
     if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Product not in watchlist")
 
-    db.commit()
+    watchlists_version = await helper.bump_watchlists_version_async(user_id, db)
+    await db.commit()
+    await watchlist_cache.change_products(user_id, watchlists_version, watchlist_id, removed=[product_id])
     return {"message": "Product removed from watchlist", "watchlist_id": watchlist_id}
 
 
 @app.delete("/users/{user_id}/watchlist/{watchlist_id}")
-async def delete_watchlist(user_id: int, watchlist_id: int, db: db_dependency):
-    watchlist = db.query(Watchlist).filter(Watchlist.user_id == user_id, Watchlist.id == watchlist_id).first()
+async def delete_watchlist(user_id: int, watchlist_id: int, token: token_dependency, db: db_dependency):
+    watchlist = await get_owned_watchlist(db, user_id, watchlist_id)
     if not watchlist:
         raise HTTPException(status_code=404, detail="Watchlist not found")
 
-    db.delete(watchlist)
-    db.commit()
+    await db.delete(watchlist)
+    watchlists_version = await helper.bump_watchlists_version_async(user_id, db)
+    await db.commit()
+    await watchlist_cache.remove_watchlist(user_id, watchlists_version, watchlist_id)
 
     return {"message": "Watchlist deleted"}
 
 
+@app.get("/users/{user_id}/alerts", response_model=PriceAlertsResponse)
+async def get_price_alerts(
+    user_id: int,
+    token: token_dependency,
+    response: Response,
+    db: db_dependency,
+    after: int = Query(0, ge=0, description="next_after of the previous poll, only newer alerts are returned"),
+    limit: int = Query(50, ge=1, le=200),
+):
+    """Price drops on the user's watched products, queued by the scrapers' ingest. Poll with the last next_after"""
+    result = fast_json.respond(await helper.fetch_price_alerts_async(user_id, db, after, limit))
+    return http_cache.without_caching(result, response)
+
+
 @app.post("/login")
 async def login(user: LoginSchema, db: db_dependency):
     # Check if the user exists and validate the password
-    db_user = get_user_by_email(db, email=user.email)
-    if db_user is None or not helper.verify_password(user.password, db_user.password):
+    db_user = await get_user_by_email(db, email=user.email)
+    if db_user is None or not await password_pool.verify_password(user.password, db_user.password):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
+    # BCRYPT_ROUNDS changed since this hash was made: store one with the current cost
+    new_hash = await password_pool.rehash_if_needed(user.password, db_user.password)
+    if new_hash is not None:
+        db_user.password = new_hash
+        await db.commit()
+
     user_data = {
         "id": db_user.id,
         "email": db_user.email,
@@ -227,4 +461,17 @@ async def login(user: LoginSchema, db: db_dependency):
         "username": db_user.username,
         "last_name": db_user.last_name,
     }
-    return {"message": f"Login successful, welcome {db_user.first_name}", "user": user_data}
+    result = {"message": f"Login successful, welcome {db_user.first_name}", "user": user_data}
+    if auth.TOKENS_ENABLED:
+        result["access_token"] = auth.issue_token(db_user.id, db_user.email)  # type: ignore
+        result["token_type"] = "bearer"
+        result["expires_in"] = auth.TOKEN_TTL_SECONDS
+    return result
+
+
+@app.post("/logout", status_code=204)
+async def logout(claims: Annotated[dict | None, Depends(auth.token_claims)]):
+    """Revokes the bearer token until it expires (deny list of this worker)"""
+    if claims is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    auth.deny_list.revoke_token(claims)
@@ -1,6 +1,7 @@
 from sqlalchemy import (
+    DDL,
+    BigInteger,
     Index,
-    create_engine,
     Column,
     Integer,
     String,
@@ -11,16 +12,21 @@ from sqlalchemy import (
     func,
     Table,
     desc,
+    event,
+    text,
 )
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.orm import relationship, sessionmaker, declarative_base
 from dotenv import load_dotenv
 import os
+import threading
+
+from data.partitions import create_initial_partitions
+from data.pool import make_async_engine, make_engine, pool_status
 
 load_dotenv()
 
-DATABASE_URL = os.environ.get("DATABASE_URL")
-if DATABASE_URL is None:
-    raise ValueError("DATABASE_URL environment variable must be set")
 Base = declarative_base()
 
 
@@ -33,6 +39,8 @@ class User(Base):
     username = Column(String(20))
     email = Column(String(254), nullable=False, unique=True)
     created_at = Column(TIMESTAMP, server_default=func.now())  # func.now() calls CURRENT_TIMESTAMP on postesgre
+    # bumped on every watchlist change of this user, the watchlist endpoints derive their ETag from it
+    watchlists_version = Column(Integer, nullable=False, server_default="0")
 
     watchlists = relationship("Watchlist", back_populates="user", cascade="all, delete-orphan")
 
@@ -44,6 +52,9 @@ class Shop(Base):
     website_url = Column(String(255), nullable=False)
     logo_url = Column(String(255))
     created_at = Column(TIMESTAMP, server_default=func.now())
+    # bumped by every ingest commit for this shop, read by the api to invalidate cached data
+    data_version = Column(Integer, nullable=False, server_default="0")
+    data_updated_at = Column(TIMESTAMP)
 
     products = relationship("Product", back_populates="shop")
 
@@ -58,13 +69,33 @@ class Product(Base):
     img_thumbnail_src = Column(String(255))
     shop_id = Column(Integer, ForeignKey("shops.id"), nullable=False)
     created_at = Column(TIMESTAMP, server_default=func.now())
+    # md5 over name, link and image urls (scraper_helpers.product_content_hash), ingest only
+    # rewrites products whose scraped hash differs and sets updated_at
+    content_hash = Column(String(32))
+    updated_at = Column(TIMESTAMP, server_default=func.now())
 
     shop = relationship("Shop", back_populates="products")
     price_history = relationship("PriceHistory", back_populates="product", order_by="PriceHistory.created_at")
     watchlists = relationship("Watchlist", secondary="watchlist_products", back_populates="products")
 
+    __table_args__ = (
+        # trigram index serves both ILIKE '%term%' and the fuzzy (similarity) search mode
+        Index(
+            "idx_products_name_normalized_trgm",
+            "name_normalized",
+            postgresql_using="gin",
+            postgresql_ops={"name_normalized": "gin_trgm_ops"},
+        ),
+        # product identity inside a shop: the link, or the name for products the shop gives no link for.
+        # ingest upserts against these (ON CONFLICT), so reruns and racing scrapers can't duplicate products
+        Index("uq_products_shop_link", "shop_id", "link", unique=True),
+        Index("uq_products_shop_name_no_link", "shop_id", "name", unique=True, postgresql_where=text("link IS NULL")),
+    )
+
 
 class PriceHistory(Base):
+    """Partitioned by month on created_at (see data/partitions.py), so the primary key includes it"""
+
     __tablename__ = "price_history"
     id = Column(Integer, primary_key=True, autoincrement=True)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
@@ -75,11 +106,17 @@ class PriceHistory(Base):
     _discounted_price_per_kg = Column("discounted_price_per_kg", Integer)
     discount_percentage = Column(Numeric(5, 2))
     sale_tag = Column(String(50))
-    created_at = Column(TIMESTAMP, server_default=func.now())
+    # rows are validity intervals: created_at is when the price was first seen (valid_from),
+    # ingest moves last_seen_at forward while the scraped price stays the same
+    created_at = Column(TIMESTAMP, primary_key=True, server_default=func.now())
+    last_seen_at = Column(TIMESTAMP, server_default=func.now())
     # association table. use products row for all queries
     product = relationship("Product", back_populates="price_history")
 
-    __table_args__ = (Index("idx_price_history_latest", "product_id", desc("created_at")),)
+    __table_args__ = (
+        Index("idx_price_history_latest", "product_id", desc("created_at")),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
     @property
     def regular_price(self):
@@ -127,12 +164,70 @@ class PriceHistory(Base):
             self._discounted_price_per_kg = None
 
 
+class ProductLatestPrice(Base):
+    """Copy of the newest price_history row per product, kept current by ingest (add_new_offers).
+    Read paths join this instead of probing price_history for its latest row."""
+
+    __tablename__ = "product_latest_price"
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    # stored in cents like price_history
+    regular_price = Column(Integer)
+    discounted_price = Column(Integer)
+    price_per_kg = Column(Integer)
+    discounted_price_per_kg = Column(Integer)
+    discount_percentage = Column(Numeric(5, 2))
+    sale_tag = Column(String(50))
+    created_at = Column(TIMESTAMP, server_default=func.now())  # = created_at of the current price_history row
+    # last scrape that saw this price: the search order and "last_updated" of the api
+    last_seen_at = Column(TIMESTAMP, server_default=func.now())
+
+
+class ProductGroup(Base):
+    """Same product across shops, written offline by scripts/match_products.py.
+    group_id is the smallest product id in the group, unmatched products are their own group."""
+
+    __tablename__ = "product_groups"
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    group_id = Column(Integer, nullable=False, index=True)
+    matched_at = Column(TIMESTAMP, server_default=func.now())
+
+
+class ProductLshBucket(Base):
+    """MinHash LSH band buckets of every matched product (scripts/match_products.py). Incremental matching
+    hashes only the new products and probes these, instead of re-signing the whole catalog."""
+
+    __tablename__ = "product_lsh_buckets"
+    bucket = Column(BigInteger, primary_key=True)  # 64 bit hash of (size block, band, band rows)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True, index=True)
+
+
+class PriceAlert(Base):
+    """Outbox of price drops on watched products. Ingest writes them for the products whose price changed
+    in that run (scraper_helpers.ENQUEUE_PRICE_ALERTS_SQL), the app polls /users/{id}/alerts?after=<last id>."""
+
+    __tablename__ = "price_alerts"
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    # effective price (discounted, else regular) in cents, before and after the drop
+    old_price = Column(Integer, nullable=False)
+    new_price = Column(Integer, nullable=False)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+
+    __table_args__ = (
+        Index("idx_price_alerts_user_id", "user_id", "id"),
+        Index("idx_price_alerts_created_at", "created_at"),  # retention (scraper_helpers.prune_price_alerts)
+    )
+
+
 watchlist_products = Table(
     "watchlist_products",
     Base.metadata,
     Column("watchlist_id", Integer, ForeignKey("watchlists.id", ondelete="CASCADE")),
     Column("product_id", Integer, ForeignKey("products.id", ondelete="CASCADE")),
     UniqueConstraint("watchlist_id", "product_id", name="watchlist_product_uc"),
+    # the unique constraint leads with watchlist_id, price alerts look up the watchers of a product
+    Index("idx_watchlist_products_product_id", "product_id"),
 )
 
 
@@ -147,11 +242,96 @@ class Watchlist(Base):
     products = relationship("Product", secondary="watchlist_products", back_populates="watchlists")
 
 
+# The schema is created and upgraded by scripts/migrate.py (create_all on an empty database, then
+# migrations/*.sql), never on import.
+# gin_trgm_ops needs the extension before create_all builds the products index
+event.listen(Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+# a partitioned table without partitions rejects every insert
+event.listen(PriceHistory.__table__, "after_create", create_initial_partitions)
+
 # port 5432
 
-# Create the database engine and tables
-engine = create_engine(DATABASE_URL)
+# Engines are created on first use, importing this module (api workers, scrapers, scripts) connects nowhere
+# and doesn't need DATABASE_URL yet. Pool settings from DB_POOL_* env, see data/pool.py
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def database_url() -> str:
+    url = os.environ.get("DATABASE_URL")
+    if url is None:
+        raise ValueError("DATABASE_URL environment variable must be set")
+    return url
+
+
+def _get_or_create(name: str, factory):
+    engine = _engines.get(name)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(name)
+            if engine is None:
+                engine = _engines[name] = factory()
+    return engine
+
+
+def get_engine():
+    """Sync (psycopg2) engine of the scrapers and scripts"""
+    return _get_or_create("sync", lambda: make_engine(database_url()))
+
+
+def get_async_engine():
+    """Async engine for the api, so queries dont block the event loop"""
+    return _get_or_create("async", lambda: make_async_engine(to_async_url(database_url())))
+
+
+class LazySessionMaker(sessionmaker):
+    """sessionmaker that binds to its engine when the first session is made"""
+
+    def __init__(self, engine_factory, **kwargs):
+        super().__init__(**kwargs)
+        self.engine_factory = engine_factory
+
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None:
+            self.configure(bind=self.engine_factory())
+        return super().__call__(**local_kw)
+
+
+class LazyAsyncSessionMaker(async_sessionmaker):
+    """Same for the api's AsyncSession"""
+
+    def __init__(self, engine_factory, **kwargs):
+        super().__init__(**kwargs)
+        self.engine_factory = engine_factory
+
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None:
+            self.configure(bind=self.engine_factory())
+        return super().__call__(**local_kw)
+
+
+SessionLocal = LazySessionMaker(get_engine, autocommit=False, autoflush=False)
+
+
+def to_async_url(database_url: str):
+    """Same database through asyncpg. asyncpg takes ssl= instead of libpq's sslmode="""
+    url = make_url(database_url).set(drivername="postgresql+asyncpg")
+    if "sslmode" in url.query:
+        sslmode = url.query["sslmode"]
+        url = url.difference_update_query(["sslmode"]).update_query_dict({"ssl": sslmode})
+    return url
+
+
+# Sessions for the api. Scrapers keep the sync SessionLocal
+# expire_on_commit=False: attributes stay readable after commit without an implicit (sync) refresh
+AsyncSessionLocal = LazyAsyncSessionMaker(get_async_engine, autoflush=False, expire_on_commit=False)
+
 
-# If the tables exist, dont recreate
-Base.metadata.create_all(engine)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def engines_pool_status() -> dict:
+    """Pools of the engines this process created so far"""
+    status = {}
+    if "sync" in _engines:
+        status["sync"] = pool_status(_engines["sync"].pool)
+    if "async" in _engines:
+        status["async"] = pool_status(_engines["async"].sync_engine.pool)
+    return status
@@ -0,0 +1,126 @@
+import re
+from datetime import date
+
+from sqlalchemy.sql import text
+
+# price_history is range partitioned by month on created_at (price_history_2026_10 holds October 2026).
+# Partitions are created ahead of time: before every scraper run (scripts/run_scrapers.py) and when
+# scripts/migrate.py builds a fresh database. Old months are detached (kept as plain tables to archive) or dropped
+# by: python -m scripts.price_history_partitions retention --keep-months N [--drop]
+
+PARENT_TABLE = "price_history"
+PARTITION_PATTERN = re.compile(r"^price_history_(\d{4})_(\d{2})$")
+
+PARTITIONS_SQL = """
+    SELECT child.relname
+    FROM pg_inherits
+    JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE parent.relname = :parent
+    ORDER BY child.relname
+"""
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_{month:%Y_%m}"
+
+
+def partition_month(name: str) -> date | None:
+    match = PARTITION_PATTERN.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def create_partition_sql(month: date) -> str:
+    # names and bounds come from dates, nothing user supplied goes in the ddl
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {PARENT_TABLE} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    )
+
+
+# Current prices (product_latest_price) whose price_history row starts before the retention cutoff are copied
+# to the cutoff before their month goes, so the open interval stays extendable by ingest and the history
+# still shows the current price. The older part of the interval is retired with its month.
+CARRY_CURRENT_PRICES_SQL = """
+    WITH carried AS (
+        INSERT INTO price_history (
+            product_id, regular_price, discounted_price, price_per_kg,
+            discounted_price_per_kg, discount_percentage, sale_tag, created_at, last_seen_at
+        )
+        SELECT ph.product_id, ph.regular_price, ph.discounted_price, ph.price_per_kg,
+               ph.discounted_price_per_kg, ph.discount_percentage, ph.sale_tag,
+               :cutoff, greatest(ph.last_seen_at, :cutoff)
+        FROM product_latest_price lp
+        JOIN price_history ph ON ph.product_id = lp.product_id AND ph.created_at = lp.created_at
+        WHERE lp.created_at < :cutoff
+          AND ph.created_at < :cutoff
+        RETURNING product_id, last_seen_at
+    )
+    UPDATE product_latest_price lp
+    SET created_at = :cutoff, last_seen_at = carried.last_seen_at
+    FROM carried
+    WHERE lp.product_id = carried.product_id
+"""
+
+
+def list_partitions(connection) -> list[str]:
+    return list(connection.execute(text(PARTITIONS_SQL), {"parent": PARENT_TABLE}).scalars())
+
+
+def ensure_partitions(connection, months_ahead: int = 1, today: date | None = None) -> list[str]:
+    """
+    Creates the partitions from the current month up to months_ahead months later.
+    Returns:
+        list[str]: names of the partitions that didn't exist yet
+    """
+    current = month_start(today or date.today())
+    existing = set(list_partitions(connection))
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if partition_name(month) not in existing:
+            connection.execute(text(create_partition_sql(month)))
+            created.append(partition_name(month))
+    return created
+
+
+def retire_partitions(connection, keep_months: int, drop: bool = False, today: date | None = None) -> list[str]:
+    """
+    Detaches (or drops) the partitions older than keep_months months before the current one.
+    Detached partitions stay as standalone tables, pg_dump them before dropping.
+    Current prices still stored in them are carried to the cutoff first (CARRY_CURRENT_PRICES_SQL).
+    Returns:
+        list[str]: names of the retired partitions
+    """
+    cutoff = add_months(month_start(today or date.today()), -keep_months)
+    retiring = []
+    for name in list_partitions(connection):
+        month = partition_month(name)
+        if month is not None and month < cutoff:
+            retiring.append(name)
+    if not retiring:
+        return []
+
+    connection.execute(text(create_partition_sql(cutoff)))  # the carried rows land in the cutoff month
+    connection.execute(text(CARRY_CURRENT_PRICES_SQL), {"cutoff": cutoff})
+    retired = []
+    for name in retiring:
+        connection.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+        if drop:
+            connection.execute(text(f"DROP TABLE {name}"))
+        retired.append(name)
+    return retired
+
+
+def create_initial_partitions(target, connection, **kw):
+    """after_create hook of price_history, a fresh database gets the current and next month"""
+    ensure_partitions(connection)
@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+
+# Shared engine factory for the api, the scrapers and the benchmarks.
+# Pool settings come from the environment:
+#   DB_POOL_SIZE (5)  DB_MAX_OVERFLOW (10)  DB_POOL_TIMEOUT seconds (30)  DB_POOL_RECYCLE seconds (1800)
+#   DB_POOL_PRE_PING (true)
+#   DB_PGBOUNCER (false)  PgBouncer in transaction mode does the pooling: no client pool (NullPool)
+#                         and no server side prepared statements (asyncpg would cache them per connection)
+
+
+def env_flag(name: str, default: bool) -> bool:
+    return os.environ.get(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+def pgbouncer_mode() -> bool:
+    return env_flag("DB_PGBOUNCER", False)
+
+
+def pool_settings() -> dict:
+    if pgbouncer_mode():
+        return {"pool_pre_ping": env_flag("DB_POOL_PRE_PING", True)}
+    return {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": env_flag("DB_POOL_PRE_PING", True),
+    }
+
+
+class PoolMetrics:
+    """How long checkouts waited for a connection. Separates 'waiting for the pool' from 'waiting for postgres'"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.recent_waits = deque(maxlen=1000)
+        self._lock = threading.Lock()
+
+    def record(self, wait_seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.wait_total += wait_seconds
+            self.wait_max = max(self.wait_max, wait_seconds)
+            self.recent_waits.append(wait_seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            recent = sorted(self.recent_waits)
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else None,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+                "wait_p50_ms": round(recent[len(recent) // 2] * 1000, 3) if recent else None,
+                "wait_p95_ms": round(recent[int(len(recent) * 0.95)] * 1000, 3) if recent else None,
+            }
+
+
+class InstrumentedPoolMixin:
+    """Times every checkout (_do_get is where a pool blocks when all connections are in use)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record(time.perf_counter() - started, timed_out=True)
+            raise
+        self.metrics.record(time.perf_counter() - started)
+        return connection
+
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+class InstrumentedNullPool(InstrumentedPoolMixin, NullPool):
+    pass  # wait = time to open a new connection
+
+
+def make_engine(url, **kwargs):
+    """Sync (psycopg2) engine with the shared pool settings"""
+    pool_class = InstrumentedNullPool if pgbouncer_mode() else InstrumentedQueuePool
+    return create_engine(url, poolclass=pool_class, **{**pool_settings(), **kwargs})
+
+
+def make_async_engine(url, **kwargs):
+    """asyncpg engine with the shared pool settings"""
+    if pgbouncer_mode():
+        url = url.update_query_dict({"prepared_statement_cache_size": "0"})
+        kwargs.setdefault("connect_args", {"statement_cache_size": 0})
+        pool_class = InstrumentedNullPool
+    else:
+        pool_class = InstrumentedAsyncQueuePool
+    return create_async_engine(url, poolclass=pool_class, **{**pool_settings(), **kwargs})
+
+
+def pool_status(pool) -> dict:
+    """Current occupancy + checkout wait metrics of a pool"""
+    status = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update(
+            {
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),  # in use right now
+                "overflow": pool.overflow(),
+                "max_overflow": pool._max_overflow,
+            }
+        )
+    metrics = getattr(pool, "metrics", None)
+    if metrics is not None:
+        status.update(metrics.snapshot())
+    return status
@@ -0,0 +1,10 @@
+-- Trigram index for product search.
+-- Serves the substring mode (ILIKE '%term%') and the fuzzy mode (<% / word_similarity).
+-- CONCURRENTLY cannot run inside a transaction block, scripts/migrate.py sends it as a statement of its own.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_products_name_normalized_trgm
+    ON products USING gin (name_normalized gin_trgm_ops);
+
+ANALYZE products;
@@ -0,0 +1,32 @@
+-- Latest price per product, maintained by ingest from the COPY staging table
+-- (scraper_helpers.record_staged_prices, UPSERT_LATEST_PRICES_SQL).
+-- Replaces the LATERAL "newest price_history row" probe on every read path.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS product_latest_price (
+    product_id integer PRIMARY KEY REFERENCES products (id) ON DELETE CASCADE,
+    regular_price integer,
+    discounted_price integer,
+    price_per_kg integer,
+    discounted_price_per_kg integer,
+    discount_percentage numeric(5, 2),
+    sale_tag varchar(50),
+    created_at timestamp DEFAULT now()
+);
+
+-- Backfill from history, idx_price_history_latest serves the DISTINCT ON order
+INSERT INTO product_latest_price (
+    product_id, regular_price, discounted_price, price_per_kg,
+    discounted_price_per_kg, discount_percentage, sale_tag, created_at
+)
+SELECT DISTINCT ON (product_id)
+    product_id, regular_price, discounted_price, price_per_kg,
+    discounted_price_per_kg, discount_percentage, sale_tag, created_at
+FROM price_history
+ORDER BY product_id, created_at DESC
+ON CONFLICT (product_id) DO NOTHING;
+
+COMMIT;
+
+ANALYZE product_latest_price;
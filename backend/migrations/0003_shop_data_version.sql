@@ -0,0 +1,5 @@
+-- Per-shop data version, bumped by every ingest commit.
+-- The api compares it against cached search results to drop only the affected shops' entries.
+
+ALTER TABLE shops ADD COLUMN IF NOT EXISTS data_version integer NOT NULL DEFAULT 0;
+ALTER TABLE shops ADD COLUMN IF NOT EXISTS data_updated_at timestamp;
@@ -0,0 +1,10 @@
+-- Cross-shop product groups, filled by: python -m scripts.match_products --full
+-- (afterwards run_scrapers matches only new products after every ingest)
+
+CREATE TABLE IF NOT EXISTS product_groups (
+    product_id integer PRIMARY KEY REFERENCES products (id) ON DELETE CASCADE,
+    group_id integer NOT NULL,
+    matched_at timestamp DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS ix_product_groups_group_id ON product_groups (group_id);
@@ -0,0 +1,4 @@
+-- Per-user watchlist modification stamp, bumped by every watchlist edit.
+-- The watchlist endpoints derive their ETag from it (If-None-Match -> 304).
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS watchlists_version integer NOT NULL DEFAULT 0;
@@ -0,0 +1,64 @@
+-- Moves price_history to monthly range partitions on created_at (data/partitions.py).
+-- Runs in one transaction, the table is locked while the rows are copied: run it between scraper runs.
+-- Afterwards partitions are created ahead by run_scrapers, old ones retired by
+-- python -m scripts.price_history_partitions retention --keep-months N
+
+BEGIN;
+
+ALTER TABLE price_history RENAME TO price_history_unpartitioned;
+ALTER INDEX idx_price_history_latest RENAME TO idx_price_history_unpartitioned_latest;
+
+-- the partition key has to be part of the primary key
+CREATE TABLE price_history (
+    id integer NOT NULL DEFAULT nextval('price_history_id_seq'),
+    product_id integer NOT NULL REFERENCES products (id),
+    regular_price integer,
+    discounted_price integer,
+    price_per_kg integer,
+    discounted_price_per_kg integer,
+    discount_percentage numeric(5, 2),
+    sale_tag varchar(50),
+    created_at timestamp NOT NULL DEFAULT now(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- partitioned index, every partition gets its own copy
+CREATE INDEX idx_price_history_latest ON price_history (product_id, created_at DESC);
+
+-- one partition per month from the oldest row up to next month
+DO $$
+DECLARE
+    month date;
+BEGIN
+    FOR month IN
+        SELECT generate_series(
+            (SELECT date_trunc('month', COALESCE(min(created_at), now())) FROM price_history_unpartitioned),
+            date_trunc('month', now()) + interval '1 month',
+            interval '1 month'
+        )::date
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF price_history FOR VALUES FROM (%L) TO (%L)',
+            'price_history_' || to_char(month, 'YYYY_MM'),
+            month,
+            (month + interval '1 month')::date
+        );
+    END LOOP;
+END $$;
+
+INSERT INTO price_history (
+    id, product_id, regular_price, discounted_price, price_per_kg,
+    discounted_price_per_kg, discount_percentage, sale_tag, created_at
+)
+SELECT
+    id, product_id, regular_price, discounted_price, price_per_kg,
+    discounted_price_per_kg, discount_percentage, sale_tag, COALESCE(created_at, now())
+FROM price_history_unpartitioned;
+
+-- keep the id sequence when the old table goes
+ALTER SEQUENCE price_history_id_seq OWNED BY price_history.id;
+DROP TABLE price_history_unpartitioned;
+
+COMMIT;
+
+ANALYZE price_history;
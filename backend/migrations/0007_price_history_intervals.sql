@@ -0,0 +1,14 @@
+-- Change-only price recording: price_history rows become validity intervals
+-- [created_at, last_seen_at], ingest extends the current interval instead of inserting identical rows.
+
+BEGIN;
+
+ALTER TABLE price_history ADD COLUMN IF NOT EXISTS last_seen_at timestamp;
+ALTER TABLE price_history ALTER COLUMN last_seen_at SET DEFAULT now();
+UPDATE price_history SET last_seen_at = created_at WHERE last_seen_at IS NULL;
+
+ALTER TABLE product_latest_price ADD COLUMN IF NOT EXISTS last_seen_at timestamp;
+ALTER TABLE product_latest_price ALTER COLUMN last_seen_at SET DEFAULT now();
+UPDATE product_latest_price SET last_seen_at = created_at WHERE last_seen_at IS NULL;
+
+COMMIT;
@@ -0,0 +1,64 @@
+-- Unique product identity per shop: (shop_id, link), or (shop_id, name) for products without a link.
+-- Existing duplicates are merged into the oldest product (smallest id) first: their price history,
+-- watchlist entries and latest price move to it, then the duplicates are deleted.
+-- Run it between scraper runs, ingest relies on the indexes (ON CONFLICT) afterwards.
+
+BEGIN;
+
+CREATE TEMP TABLE product_duplicates ON COMMIT DROP AS
+SELECT id AS duplicate_id, keep_id
+FROM (
+    SELECT id, min(id) OVER (PARTITION BY shop_id, link) AS keep_id
+    FROM products
+    WHERE link IS NOT NULL
+    UNION ALL
+    SELECT id, min(id) OVER (PARTITION BY shop_id, name) AS keep_id
+    FROM products
+    WHERE link IS NULL
+) ranked
+WHERE id <> keep_id;
+
+UPDATE price_history ph
+SET product_id = d.keep_id
+FROM product_duplicates d
+WHERE ph.product_id = d.duplicate_id;
+
+INSERT INTO watchlist_products (watchlist_id, product_id)
+SELECT wp.watchlist_id, d.keep_id
+FROM watchlist_products wp
+JOIN product_duplicates d ON d.duplicate_id = wp.product_id
+ON CONFLICT ON CONSTRAINT watchlist_product_uc DO NOTHING;
+
+-- latest price of the merged product: the newest of the group
+INSERT INTO product_latest_price (
+    product_id, regular_price, discounted_price, price_per_kg,
+    discounted_price_per_kg, discount_percentage, sale_tag, created_at, last_seen_at
+)
+SELECT DISTINCT ON (d.keep_id)
+    d.keep_id, lp.regular_price, lp.discounted_price, lp.price_per_kg,
+    lp.discounted_price_per_kg, lp.discount_percentage, lp.sale_tag, lp.created_at, lp.last_seen_at
+FROM product_duplicates d
+JOIN product_latest_price lp ON lp.product_id = d.duplicate_id
+ORDER BY d.keep_id, lp.created_at DESC
+ON CONFLICT (product_id) DO UPDATE SET
+    regular_price = EXCLUDED.regular_price,
+    discounted_price = EXCLUDED.discounted_price,
+    price_per_kg = EXCLUDED.price_per_kg,
+    discounted_price_per_kg = EXCLUDED.discounted_price_per_kg,
+    discount_percentage = EXCLUDED.discount_percentage,
+    sale_tag = EXCLUDED.sale_tag,
+    created_at = EXCLUDED.created_at,
+    last_seen_at = EXCLUDED.last_seen_at
+WHERE EXCLUDED.created_at > product_latest_price.created_at;
+
+-- watchlist_products, product_latest_price and product_groups rows of the duplicates cascade
+DELETE FROM products p
+USING product_duplicates d
+WHERE p.id = d.duplicate_id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_products_shop_link ON products (shop_id, link);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_products_shop_name_no_link ON products (shop_id, name) WHERE link IS NULL;
+
+COMMIT;
+
+-- merged products get regrouped on the next run, or now with: python -m scripts.match_products --full
@@ -0,0 +1,21 @@
+-- Product metadata hash, ingest rewrites a product only when its scraped name/link/images differ.
+-- The formula matches scripts/scrapers/scraper_helpers.product_content_hash.
+
+BEGIN;
+
+ALTER TABLE products ADD COLUMN IF NOT EXISTS content_hash varchar(32);
+ALTER TABLE products ADD COLUMN IF NOT EXISTS updated_at timestamp;
+ALTER TABLE products ALTER COLUMN updated_at SET DEFAULT now();
+
+UPDATE products
+SET content_hash = md5(concat_ws(
+        chr(31),
+        coalesce(name, ''),
+        coalesce(link, ''),
+        coalesce(img_full_src, ''),
+        coalesce(img_thumbnail_src, '')
+    )),
+    updated_at = coalesce(updated_at, created_at, now())
+WHERE content_hash IS NULL;
+
+COMMIT;
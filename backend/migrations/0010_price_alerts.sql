@@ -0,0 +1,20 @@
+-- Price drop alerts: ingest writes one row per (user, product) when a watched product's price drops,
+-- joining only the products whose price changed in that run. The app polls them by user and id.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS price_alerts (
+    id bigserial PRIMARY KEY,
+    user_id integer NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    product_id integer NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    old_price integer NOT NULL,
+    new_price integer NOT NULL,
+    created_at timestamp DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_price_alerts_user_id ON price_alerts (user_id, id);
+
+-- watchers of a product (watchlist_product_uc leads with watchlist_id)
+CREATE INDEX IF NOT EXISTS idx_watchlist_products_product_id ON watchlist_products (product_id);
+
+COMMIT;
@@ -0,0 +1,15 @@
+-- Stored MinHash LSH buckets, incremental product matching probes them instead of re-signing every product.
+-- Filled for the existing products by the next `python -m scripts.match_products` run (it does a full
+-- match while the table is empty).
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS product_lsh_buckets (
+    bucket bigint NOT NULL,
+    product_id integer NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    PRIMARY KEY (bucket, product_id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_product_lsh_buckets_product_id ON product_lsh_buckets (product_id);
+
+COMMIT;
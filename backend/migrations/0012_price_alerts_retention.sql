@@ -0,0 +1,4 @@
+-- Old price alerts are pruned before every scraper run (scraper_helpers.prune_price_alerts), by created_at.
+-- CONCURRENTLY: ingest keeps writing alerts while the index builds.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_price_alerts_created_at ON price_alerts (created_at);
@@ -0,0 +1,22 @@
+from typing import List
+from pydantic import BaseModel
+from datetime import datetime
+
+
+class PriceAlertRead(BaseModel):  # a watched product got cheaper
+    id: int
+    product_id: int
+    name: str
+    link: str | None = None
+    img_thumbnail_src: str | None = None
+    shop_id: int
+    shop_name: str
+    old_price: float
+    new_price: float
+    created_at: datetime | None = None
+
+
+class PriceAlertsResponse(BaseModel):
+    alerts: List[PriceAlertRead]  # oldest first
+    has_more: bool
+    next_after: int  # `after` for the next poll
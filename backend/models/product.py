@@ -1,5 +1,5 @@
-from typing import List
-from pydantic import BaseModel
+from typing import List, Literal
+from pydantic import BaseModel, Field
 from datetime import datetime
 
 
@@ -10,7 +10,7 @@ class PriceHistoryRead(BaseModel):
     price_per_kg: float | None = None
     discounted_price_per_kg: float | None = None
     discount_percentage: float | None = None
-    created_at: datetime | None = None
+    created_at: datetime | None = None  # since when the price holds, prices are recorded only when they change
 
     class Config:
         from_attributes = True
@@ -40,6 +40,7 @@ class ProductOut(BaseModel):
     shop_id: int
     shop_name: str
     price_history: PriceHistoryRead
+    watchlist_ids: List[int] | None = None  # the user's watchlists containing it, searches with ?user_id= only
 
     class Config:
         from_attributes = True
@@ -59,6 +60,45 @@ class ProductHistoryRead(BaseModel):  # for getting full price history of a prod
         from_attributes = True
 
 
+class PriceHistoryPoint(BaseModel):  # one day/week/month bucket of a product's history
+    bucket_start: datetime
+    min_price: float | None = None
+    max_price: float | None = None
+    last_price: float | None = None
+    last_regular_price: float | None = None
+    samples: int  # price intervals overlapping the bucket
+
+
+class ProductHistoryPoints(BaseModel):  # downsampled history for charts
+    id: int
+    name: str
+    link: str | None = None
+    img_thumbnail_src: str | None = None
+    img_full_src: str | None = None
+    shop_id: int
+    bucket: Literal["day", "week", "month"]
+    points: List[PriceHistoryPoint]  # oldest first
+    truncated: bool  # older buckets were cut off by the points cap
+
+
 class SearchResponse(BaseModel):
     products: List[ProductOut]
     has_more: bool
+    next_cursor: str | None = None  # keyset pagination, pass back as ?cursor=
+
+
+class BatchSearchRequest(BaseModel):  # shopping list search, one query per line
+    queries: List[str] = Field(..., min_length=1, max_length=30)
+    shop_ids: List[int]
+    limit: int = Field(5, ge=1, le=20)  # per query
+    mode: Literal["substring", "fuzzy"] = "substring"
+
+
+class BatchSearchResult(BaseModel):
+    query: str
+    products: List[ProductOut]
+    has_more: bool
+
+
+class BatchSearchResponse(BaseModel):
+    results: List[BatchSearchResult]
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field, model_validator
+from typing import Dict, List, Literal
 from .product import ProductRead
 
 
@@ -15,3 +15,22 @@ class WatchlistRead(BaseModel):
 
 class WatchlistCreateRequest(BaseModel):
     watchlist_name: str
+
+
+class WatchlistProductsChangeRequest(BaseModel):  # bulk add / remove, e.g. importing a shopping list
+    add: List[int] = Field(default_factory=list, max_length=500)
+    remove: List[int] = Field(default_factory=list, max_length=500)
+
+    @model_validator(mode="after")
+    def check_disjoint(self):
+        # the add runs before the remove, an id in both would be a no-op that still reports "added"
+        overlap = set(self.add) & set(self.remove)
+        if overlap:
+            raise ValueError(f"product ids both added and removed: {sorted(overlap)}")
+        return self
+
+
+class WatchlistProductsChangeResponse(BaseModel):
+    watchlist_id: int
+    added: Dict[int, Literal["added", "already_in_watchlist", "product_not_found"]]
+    removed: Dict[int, Literal["removed", "not_in_watchlist"]]
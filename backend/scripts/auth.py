@@ -0,0 +1,157 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from typing import Annotated
+
+from fastapi import Depends, Header, HTTPException, Query
+
+from scripts.logging_config import get_logger
+
+logger = get_logger("auth.py")
+
+# Stateless access tokens: /login returns base64url(json claims) + "." + base64url(hmac-sha256 of it).
+# Checking one is a hash over a few hundred bytes, no database round trip and no bcrypt.
+# Revocation (logout, deleted users) goes through a small in-memory deny list that forgets entries once
+# the tokens they cover have expired anyway. It's per worker, like the other in-process caches.
+#
+#   AUTH_SECRET        signing key, shared by all workers. Unset: no tokens are issued or checked, and
+#                      REQUIRE_AUTH refuses to start (check_configuration)
+#   TOKEN_TTL_SECONDS  token lifetime (7 days)
+#   REQUIRE_AUTH       false: /users/{user_id}/... accept requests without a token like before,
+#                      a token that is sent is always checked. true: a token is required
+
+TOKEN_TTL_SECONDS = int(os.environ.get("TOKEN_TTL_SECONDS", str(7 * 24 * 3600)))
+REQUIRE_AUTH = os.environ.get("REQUIRE_AUTH", "false").strip().lower() in ("1", "true", "yes", "on")
+
+# a per-process random key would make every other worker reject the token, and every restart log users out
+SECRET = os.environ.get("AUTH_SECRET", "").encode("utf-8") or None
+TOKENS_ENABLED = SECRET is not None
+
+
+def check_configuration():
+    """At api startup"""
+    if not TOKENS_ENABLED:
+        if REQUIRE_AUTH:
+            raise RuntimeError("REQUIRE_AUTH needs AUTH_SECRET, the key tokens are signed with")
+        logger.warning("AUTH_SECRET is not set, /login issues no access tokens and none are checked")
+
+
+def b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def sign(payload: str) -> str:
+    return b64encode(hmac.new(SECRET, payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def issue_token(user_id: int, email: str) -> str:
+    now = int(time.time())
+    claims = {"sub": user_id, "email": email, "iat": now, "exp": now + TOKEN_TTL_SECONDS, "jti": secrets.token_hex(8)}
+    payload = b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    return f"{payload}.{sign(payload)}"
+
+
+def decode_token(token: str) -> dict:
+    """
+    Returns:
+        dict: the claims (sub = user id, email, iat, exp, jti)
+    Raises:
+        HTTPException: 401 when the token is malformed, tampered with, expired or revoked
+    """
+    try:
+        payload, signature = token.split(".")
+        # bytes: compare_digest refuses str with non-ascii characters (TypeError, not a 401)
+        if not hmac.compare_digest(signature.encode("utf-8"), sign(payload).encode("ascii")):
+            raise ValueError("bad signature")
+        claims = json.loads(b64decode(payload))
+    except ValueError:
+        raise HTTPException(status_code=401, detail="Invalid token", headers={"WWW-Authenticate": "Bearer"})
+
+    if claims["exp"] <= time.time():
+        raise HTTPException(status_code=401, detail="Token expired", headers={"WWW-Authenticate": "Bearer"})
+    if deny_list.is_denied(claims):
+        raise HTTPException(status_code=401, detail="Token revoked", headers={"WWW-Authenticate": "Bearer"})
+    return claims
+
+
+class DenyList:
+    def __init__(self):
+        self._tokens: dict[str, float] = {}  # jti -> token expiry
+        self._users: dict[int, float] = {}  # user id -> revoked at, tokens issued until then are denied
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float):
+        self._tokens = {jti: exp for jti, exp in self._tokens.items() if exp > now}
+        self._users = {uid: at for uid, at in self._users.items() if at + TOKEN_TTL_SECONDS > now}
+
+    def revoke_token(self, claims: dict):
+        with self._lock:
+            self._prune(time.time())
+            self._tokens[claims["jti"]] = claims["exp"]
+
+    def revoke_user(self, user_id: int):
+        """Every token issued to the user so far (account deleted)"""
+        with self._lock:
+            now = time.time()
+            self._prune(now)
+            self._users[user_id] = now
+
+    def is_denied(self, claims: dict) -> bool:
+        with self._lock:
+            if claims["jti"] in self._tokens:
+                return True
+            revoked_at = self._users.get(claims["sub"])
+            return revoked_at is not None and claims["iat"] <= revoked_at
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"tokens": len(self._tokens), "users": len(self._users)}
+
+
+deny_list = DenyList()
+
+
+def token_claims(authorization: Annotated[str | None, Header()] = None) -> dict | None:
+    """
+    Dependency: claims of the bearer token, None when the request has none (and tokens aren't required)
+    or when tokens are off (no AUTH_SECRET)
+    """
+    if not TOKENS_ENABLED:
+        return None
+    if not authorization:
+        if REQUIRE_AUTH:
+            raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Invalid token", headers={"WWW-Authenticate": "Bearer"})
+    return decode_token(token.strip())
+
+
+def authorize_user(user_id: int, claims: Annotated[dict | None, Depends(token_claims)]) -> dict | None:
+    """
+    Dependency for /users/{user_id}/... routes: the token has to belong to the user in the path.
+    Returns:
+        dict | None: the claims, a route that gets them knows the user exists without querying it
+    """
+    if claims is not None and claims["sub"] != user_id:
+        raise HTTPException(status_code=403, detail="Not allowed for this user")
+    return claims
+
+
+def authorize_optional_user(
+    authorization: Annotated[str | None, Header()] = None, user_id: Annotated[int | None, Query()] = None
+) -> dict | None:
+    """Same for routes with an optional ?user_id= (per user data added to a public response)"""
+    if user_id is None:
+        return None
+    return authorize_user(user_id, token_claims(authorization))
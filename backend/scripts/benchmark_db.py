@@ -1,18 +1,9 @@
-import os
 import time
 import json
 from datetime import datetime
-from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import text
 
-load_dotenv()
-DATABASE_URL = os.environ.get("DATABASE_URL")
-if DATABASE_URL is None:
-    raise ValueError("DATABASE_URL environment variable must be set")
-
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+from data.database import SessionLocal  # same engine + pool settings as the api and scrapers
 
 
 class PriceHistoryBenchmark:
@@ -93,13 +84,7 @@ class PriceHistoryBenchmark:
             lp.created_at AS price_created_at
         FROM products p
         JOIN shops s ON p.shop_id = s.id
-        LEFT JOIN LATERAL (
-            SELECT ph.*
-            FROM price_history ph
-            WHERE ph.product_id = p.id
-            ORDER BY ph.created_at DESC
-            LIMIT 1
-        ) lp ON true
+        LEFT JOIN product_latest_price lp ON lp.product_id = p.id
         WHERE s.id = ANY(:shop_ids)"""
 
         # Test scenarios: shop counts × search terms
@@ -134,7 +119,7 @@ class PriceHistoryBenchmark:
 
                 # Add ordering and limit
                 sql += """
-                ORDER BY lp.created_at DESC NULLS LAST
+                ORDER BY lp.last_seen_at DESC NULLS LAST
                 LIMIT :limit OFFSET :offset"""
 
                 # Run benchmark
@@ -202,15 +187,9 @@ class PriceHistoryBenchmark:
             lp.created_at AS price_created_at
         FROM products p
         JOIN shops s ON p.shop_id = s.id
-        LEFT JOIN LATERAL (
-            SELECT ph.*
-            FROM price_history ph
-            WHERE ph.product_id = p.id
-            ORDER BY ph.created_at DESC
-            LIMIT 1
-        ) lp ON true
+        LEFT JOIN product_latest_price lp ON lp.product_id = p.id
         WHERE s.id = ANY(:shop_ids)
-        ORDER BY lp.created_at DESC NULLS LAST
+        ORDER BY lp.last_seen_at DESC NULLS LAST
         LIMIT 20
         """
 
@@ -237,6 +216,7 @@ class PriceHistoryBenchmark:
         # Update statistics
         self.log("📊 Updating table statistics...")
         self.session.execute(text("ANALYZE price_history"))
+        self.session.execute(text("ANALYZE product_latest_price"))
         self.session.execute(text("ANALYZE products"))
         self.session.execute(text("ANALYZE shops"))
         self.session.commit()
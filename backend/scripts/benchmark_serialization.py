@@ -0,0 +1,73 @@
+import json
+import timeit
+from datetime import datetime
+from decimal import Decimal
+
+from models.product import SearchResponse
+import scripts.fast_json as fast_json
+
+# Micro-benchmark of the /products/search response encoding, no database needed:
+#   pydantic: what FastAPI does with response_model (validate the dicts, serialize in json mode, json.dumps)
+#   orjson:   the FAST_JSON path (reshape the dicts, orjson.dumps)
+# Usage: python -m scripts.benchmark_serialization
+
+
+def sample_page(size: int = 40) -> tuple[list, bool, str]:
+    """A search page shaped like helper.product_row_to_dict output"""
+    products = []
+    for i in range(size):
+        created_at = datetime(2025, 1, 1, 7, 0, i % 60, 123456)
+        products.append(
+            {
+                "id": 100000 + i,
+                "name": f"ΔΕΛΤΑ Γάλα Φρέσκο Πλήρες 3,5% {i} 1lt",
+                "link": f"https://example.gr/product/{100000 + i}",
+                "img_thumbnail_src": f"https://example.gr/img/{i}_thumb.jpg",
+                "img_full_src": f"https://example.gr/img/{i}.jpg",
+                "shop_id": i % 6 + 1,
+                "shop_name": "sklavenitis",
+                "price_history": {
+                    "regular_price": 1.89,
+                    "discounted_price": 1.49 if i % 3 else None,
+                    "price_per_kg": 1.89,
+                    "discounted_price_per_kg": 1.49 if i % 3 else None,
+                    "sale_tag": "1+1" if i % 5 == 0 else None,
+                    "discount_percentage": Decimal("21.16") if i % 3 else None,
+                    "created_at": created_at,
+                },
+                "last_updated": created_at,
+            }
+        )
+    return products, True, "WyIyMDI1LTAxLTAxIDA3OjAwOjM5LjEyMzQ1NiIsMTAwMDM5XQ"
+
+
+def pydantic_path(products, has_more, next_cursor) -> bytes:
+    payload = {"products": products, "has_more": has_more, "next_cursor": next_cursor}
+    validated = SearchResponse.model_validate(payload)
+    content = validated.model_dump(mode="json")
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def orjson_path(products, has_more, next_cursor) -> bytes:
+    return fast_json.dumps(fast_json.search_response(products, has_more, next_cursor))
+
+
+def main(iterations: int = 2000):
+    page = sample_page()
+
+    # both paths must produce the same document
+    assert json.loads(pydantic_path(*page)) == json.loads(orjson_path(*page)), "response shapes differ"
+
+    print(f"Search page of {len(page[0])} products, {iterations} iterations")
+    print("-" * 50)
+    timings = {}
+    for name, path in (("pydantic", pydantic_path), ("orjson", orjson_path)):
+        seconds = min(timeit.repeat(lambda: path(*page), number=iterations, repeat=5))
+        timings[name] = seconds / iterations * 1_000_000
+        print(f"{name:10} | {timings[name]:10.1f} µs per response | {len(path(*page)):>6} bytes")
+    print("-" * 50)
+    print(f"speedup: {timings['pydantic'] / timings['orjson']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
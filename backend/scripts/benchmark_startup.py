@@ -0,0 +1,80 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+# Import-to-ready time of an api worker and of a scraper process, what every restart / new replica pays.
+# Each run is a fresh interpreter, so nothing is already in sys.modules.
+#   api:          import api, then with --lifespan also the FastAPI startup (shop versions, search index),
+#                 which needs the database
+#   run_scrapers: import scripts.run_scrapers
+# Usage: python -m scripts.benchmark_startup [--runs 5] [--lifespan]
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+API_PROBE = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+import api
+imported = time.perf_counter()
+ready = imported
+if {lifespan}:
+    async def startup():
+        async with api.app.router.lifespan_context(api.app):
+            return time.perf_counter()
+    ready = asyncio.run(startup())
+print(json.dumps({{"import": imported - started, "ready": ready - started}}))
+"""
+
+SCRAPERS_PROBE = """
+import json, time
+started = time.perf_counter()
+import scripts.run_scrapers
+ready = time.perf_counter()
+print(json.dumps({"import": ready - started, "ready": ready - started}))
+"""
+
+
+def run_probe(probe: str) -> dict:
+    """One fresh interpreter. `process` also counts the interpreter's own boot"""
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-c", probe], cwd=BACKEND_DIR, env=os.environ.copy(), capture_output=True, text=True
+    )
+    process = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "probe failed")
+    timings = json.loads(completed.stdout.strip().splitlines()[-1])
+    timings["process"] = process
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-to-ready time of the api and the scrapers")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--lifespan", action="store_true", help="include the api startup (needs the database)")
+    args = parser.parse_args()
+
+    targets = (("api:app", API_PROBE.format(lifespan=args.lifespan)), ("scripts.run_scrapers", SCRAPERS_PROBE))
+    print(f"{args.runs} runs each, median (min) in ms")
+    print("-" * 72)
+    for name, probe in targets:
+        try:
+            runs = [run_probe(probe) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"{name:22} | failed: {e}")
+            continue
+        columns = []
+        for key in ("import", "ready", "process"):
+            values = [run[key] * 1000 for run in runs]
+            columns.append(f"{key} {statistics.median(values):7.1f} ({min(values):7.1f})")
+        print(f"{name:22} | " + " | ".join(columns))
+    print("-" * 72)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import os
+from decimal import Decimal
+
+import orjson
+from fastapi.responses import Response
+
+# Fast response path: the helpers already build plain dicts, so instead of letting FastAPI re-validate
+# them through the response_model and re-encode with json, they are dumped straight to bytes with orjson.
+# The response_model stays on the route for the docs; a returned Response skips its validation.
+# Switch off with FAST_JSON=false to go back to the pydantic path.
+
+FAST_JSON = os.environ.get("FAST_JSON", "true").strip().lower() in ("1", "true", "yes", "on")
+
+PRODUCT_OUT_FIELDS = ("id", "name", "link", "img_thumbnail_src", "img_full_src", "shop_id", "shop_name")
+
+
+def default(value):
+    # numeric columns (discount_percentage) come back as Decimal, pydantic sends them as floats too
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(payload) -> bytes:
+    return orjson.dumps(payload, default=default)
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def product_out(product: dict) -> dict:
+    """Same keys as models.product.ProductOut (drops the extra last_updated the pydantic path drops)"""
+    shaped = {field: product[field] for field in PRODUCT_OUT_FIELDS}
+    shaped["price_history"] = product["price_history"]
+    shaped["watchlist_ids"] = product.get("watchlist_ids")  # only for searches with ?user_id=
+    return shaped
+
+
+def search_response(products: list, has_more: bool, next_cursor: str | None) -> dict:
+    """models.product.SearchResponse shape"""
+    return {
+        "products": [product_out(product) for product in products],
+        "has_more": has_more,
+        "next_cursor": next_cursor,
+    }
+
+
+def batch_search_response(results: list) -> dict:
+    """models.product.BatchSearchResponse shape"""
+    return {
+        "results": [
+            {
+                "query": result["query"],
+                "products": [product_out(product) for product in result["products"]],
+                "has_more": result["has_more"],
+            }
+            for result in results
+        ]
+    }
+
+
+def respond(payload):
+    """For routes returning helper dicts: orjson bytes, or the dict itself for FastAPI to encode when FAST_JSON is off"""
+    return FastJSONResponse(payload) if FAST_JSON else payload
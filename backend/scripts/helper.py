@@ -1,15 +1,32 @@
+import base64
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
 from typing import List
 import bcrypt
 
-from sqlalchemy.orm import joinedload, Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import text
 from unidecode import unidecode
 
-from data.database import Product, User, Watchlist
+from data.database import AsyncSessionLocal, Product, User, Watchlist
 from fastapi import HTTPException
 from scripts.logging_config import get_logger
+from scripts.search_cache import search_cache
+from scripts.search_index import SEARCH_BACKEND, search_index
+from scripts.watchlist_cache import watchlist_cache
 
 logger = get_logger("helper.py")
 
+# Query functions for the api, all on AsyncSession (*_async). The scripts write through scraper_helpers
+# and match_products on the sync SessionLocal.
+
+
+# bcrypt cost factor for new hashes, existing ones are rehashed on the next login after it changes
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+
 
 def hash_password(plain_password: str) -> str:
     """
@@ -17,7 +34,7 @@ def hash_password(plain_password: str) -> str:
         str: hashed password using bycrypt
     """
     # Generate a salt and hash the password
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(plain_password.encode("utf-8"), salt)
     return hashed.decode("utf-8")
 
@@ -30,73 +47,239 @@ def verify_password(plain_password: str, hashed_password) -> bool:
     return bcrypt.checkpw(plain_password.encode("utf-8"), hashed_password.encode("utf-8"))
 
 
-def create_watchlist_for_user(user_id: int, watchlist_name: str, db: Session):
+def password_needs_rehash(hashed_password: str) -> bool:
+    """True when the hash was made with another cost than BCRYPT_ROUNDS ($2b$<cost>$...)"""
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+async def create_watchlist_for_user_async(user_id: int, watchlist_name: str, db: AsyncSession):
+    # bump first: it 404s for a deleted user before the insert is flushed into a foreign key error
+    watchlists_version = await bump_watchlists_version_async(user_id, db)
     new_watchlist = Watchlist(
         user_id=user_id,
         name=watchlist_name,
     )
     db.add(new_watchlist)
-    db.commit()
-    db.refresh(new_watchlist)
+    await db.commit()
+    await db.refresh(new_watchlist)
+    await watchlist_cache.add_watchlist(user_id, watchlists_version, new_watchlist.id, new_watchlist.name)
     return new_watchlist
 
 
+async def get_watchlists_version_async(user_id: int, db: AsyncSession) -> int:
+    """users.watchlists_version, changes whenever any of the user's watchlists changes"""
+    version = (
+        await db.execute(text("SELECT watchlists_version FROM users WHERE id = :user_id"), {"user_id": user_id})
+    ).scalar_one_or_none()
+    if version is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return version
+
+
+async def bump_watchlists_version_async(user_id: int, db: AsyncSession) -> int:
+    """
+    Call in the same transaction as the watchlist change.
+    Returns:
+        int: the new version, for the watchlist cache write-through after commit
+    Raises:
+        HTTPException: 404 when the user is gone, a token routes skip the user lookup with can outlive it
+            (the deny list is per worker)
+    """
+    version = (
+        await db.execute(
+            text(
+                "UPDATE users SET watchlists_version = watchlists_version + 1 WHERE id = :user_id "
+                "RETURNING watchlists_version"
+            ),
+            {"user_id": user_id},
+        )
+    ).scalar_one_or_none()
+    if version is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return version
+
+
+# Watchlist membership writes, one statement per batch. ON CONFLICT replaces the check-then-insert,
+# so concurrent adds of the same product can't race.
+ADD_WATCHLIST_PRODUCTS_SQL = """
+    WITH requested AS (
+        SELECT DISTINCT unnest(CAST(:product_ids AS integer[])) AS product_id
+    ),
+    inserted AS (
+        INSERT INTO watchlist_products (watchlist_id, product_id)
+        SELECT :watchlist_id, p.id
+        FROM requested r
+        JOIN products p ON p.id = r.product_id
+        ON CONFLICT ON CONSTRAINT watchlist_product_uc DO NOTHING
+        RETURNING product_id
+    )
+    SELECT
+        r.product_id,
+        p.id IS NOT NULL AS product_exists,
+        i.product_id IS NOT NULL AS inserted
+    FROM requested r
+    LEFT JOIN products p ON p.id = r.product_id
+    LEFT JOIN inserted i ON i.product_id = r.product_id
+"""
+
+REMOVE_WATCHLIST_PRODUCTS_SQL = """
+    DELETE FROM watchlist_products
+    WHERE watchlist_id = :watchlist_id
+      AND product_id = ANY(:product_ids)
+    RETURNING product_id
+"""
+
+
+async def add_watchlist_products_async(watchlist_id: int, product_ids: List[int], db: AsyncSession) -> dict:
+    """
+    Caller checked ownership and commits.
+    Returns:
+        dict: product_id -> "added" / "already_in_watchlist" / "product_not_found"
+    """
+    if not product_ids:
+        return {}
+    rows = await db.execute(
+        text(ADD_WATCHLIST_PRODUCTS_SQL), {"watchlist_id": watchlist_id, "product_ids": list(product_ids)}
+    )
+    outcomes = {}
+    for row in rows:
+        if row.inserted:
+            outcomes[row.product_id] = "added"
+        elif row.product_exists:
+            outcomes[row.product_id] = "already_in_watchlist"
+        else:
+            outcomes[row.product_id] = "product_not_found"
+    return outcomes
+
+
+async def remove_watchlist_products_async(watchlist_id: int, product_ids: List[int], db: AsyncSession) -> dict:
+    """
+    Caller checked ownership and commits.
+    Returns:
+        dict: product_id -> "removed" / "not_in_watchlist"
+    """
+    if not product_ids:
+        return {}
+    removed = set(
+        (
+            await db.execute(
+                text(REMOVE_WATCHLIST_PRODUCTS_SQL), {"watchlist_id": watchlist_id, "product_ids": list(product_ids)}
+            )
+        ).scalars()
+    )
+    return {product_id: "removed" if product_id in removed else "not_in_watchlist" for product_id in product_ids}
+
+
 def convert_to_decimal(cents_value):
     """Convert integer cents to decimal, handling None values."""
     return cents_value / 100 if cents_value is not None else None
 
 
-def fetch_user_watchlists_with_prices(user_id: int, db: Session):
-    """Fetch user watchlists with latest price data for each product"""
-    from sqlalchemy.sql import text
+def encode_cursor(sort_key, product_id: int) -> str:
+    """
+    Returns:
+        str: opaque keyset pagination cursor pointing after the given row
+    """
+    payload = json.dumps([sort_key, product_id], default=str, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
 
-    # First verify user exists
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
 
-    # Get all watchlists with products and their latest prices
-    sql = """
-        SELECT
-            w.id as watchlist_id,
-            w.name as watchlist_name,
-            p.id as product_id,
-            p.name as product_name,
-            p.link,
-            p.img_thumbnail_src,
-            p.img_full_src,
-            p.shop_id,
-            s.name as shop_name,
-            ph.regular_price,
-            ph.discounted_price,
-            ph.price_per_kg,
-            ph.discounted_price_per_kg,
-            ph.discount_percentage,
-            ph.created_at as price_created_at
-        FROM watchlists w
-        LEFT JOIN watchlist_products wp ON w.id = wp.watchlist_id
-        LEFT JOIN products p ON wp.product_id = p.id
-        LEFT JOIN shops s ON p.shop_id = s.id
-        LEFT JOIN LATERAL (
-            SELECT
-                regular_price,
-                discounted_price,
-                price_per_kg,
-                discounted_price_per_kg,
-                discount_percentage,
-                created_at
-            FROM price_history
-            WHERE product_id = p.id
-            ORDER BY created_at DESC
-            LIMIT 1
-        ) ph ON p.id IS NOT NULL
-        WHERE w.user_id = :user_id
-        ORDER BY w.id, p.name
+def decode_cursor(cursor: str, parse_sort_key) -> tuple:
+    """
+    Args:
+        parse_sort_key: converts the stored sort key back to its sql type (called only when not None)
+    Returns:
+        tuple: (sort_key, product_id) of the last row of the previous page
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_key, product_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if sort_key is not None:
+            sort_key = parse_sort_key(sort_key)
+        return sort_key, int(product_id)
+    except (ValueError, TypeError, ArithmeticError):
+        # binascii.Error and json.JSONDecodeError are ValueErrors, decimal.InvalidOperation an ArithmeticError
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_condition(sort_expr: str, id_expr: str) -> tuple[str, str]:
+    """
+    WHERE fragments that seek past the cursor row for ORDER BY sort_expr DESC NULLS LAST, id_expr DESC.
+    Uses the :cursor_key / :cursor_id parameters.
+
+    Returns:
+        tuple(str, str): (condition when the cursor key is not null, condition when it is null)
+    """
+    not_null = f"""
+        AND ({sort_expr} < :cursor_key
+            OR ({sort_expr} = :cursor_key AND {id_expr} < :cursor_id)
+            OR {sort_expr} IS NULL)"""
+    null = f"""
+        AND {sort_expr} IS NULL AND {id_expr} < :cursor_id"""
+    return not_null, null
+
+
+def product_row_to_dict(row) -> dict:
+    """
+    Product + latest price row (search / watchlist detail) to the ProductOut shape.
+    price_history.created_at is when the current price started (prices are recorded on change),
+    last_updated when the product was last scraped (product_latest_price.last_seen_at)
     """
+    return {
+        "id": row.id,
+        "name": row.name,
+        "link": row.link,
+        "img_thumbnail_src": row.img_thumbnail_src,
+        "img_full_src": row.img_full_src,
+        "shop_id": row.shop_id,
+        "shop_name": row.shop_name,
+        "price_history": {
+            "regular_price": convert_to_decimal(row.regular_price),
+            "discounted_price": convert_to_decimal(row.discounted_price),
+            "price_per_kg": convert_to_decimal(row.price_per_kg),
+            "discounted_price_per_kg": convert_to_decimal(row.discounted_price_per_kg),
+            "sale_tag": row.sale_tag,
+            "discount_percentage": row.discount_percentage,
+            "created_at": row.price_created_at,
+        },
+        "last_updated": row.price_last_seen_at,
+    }
+
 
-    rows = db.execute(text(sql), {"user_id": user_id}).fetchall()
+# Get all watchlists with products and their latest prices (product_latest_price is kept current by ingest)
+WATCHLISTS_WITH_PRICES_SQL = """
+    SELECT
+        w.id as watchlist_id,
+        w.name as watchlist_name,
+        p.id as product_id,
+        p.name as product_name,
+        p.link,
+        p.img_thumbnail_src,
+        p.img_full_src,
+        p.shop_id,
+        s.name as shop_name,
+        ph.regular_price,
+        ph.discounted_price,
+        ph.price_per_kg,
+        ph.discounted_price_per_kg,
+        ph.discount_percentage,
+        ph.created_at as price_created_at,
+        ph.last_seen_at as price_last_seen_at
+    FROM watchlists w
+    LEFT JOIN watchlist_products wp ON w.id = wp.watchlist_id
+    LEFT JOIN products p ON wp.product_id = p.id
+    LEFT JOIN shops s ON p.shop_id = s.id
+    LEFT JOIN product_latest_price ph ON ph.product_id = p.id
+    WHERE w.user_id = :user_id
+    ORDER BY w.id, p.name
+"""
 
-    # Group by watchlist
+
+def group_watchlist_rows(rows) -> list:
+    """Group the flat watchlist/product rows of WATCHLISTS_WITH_PRICES_SQL by watchlist"""
     watchlists_dict = {}
 
     for row in rows:
@@ -127,42 +310,53 @@ def fetch_user_watchlists_with_prices(user_id: int, db: Session):
                     if row.regular_price is not None
                     else None
                 ),
-                "last_updated": row.price_created_at,
+                "last_updated": row.price_last_seen_at,
             }
             watchlists_dict[watchlist_id]["products"].append(product_data)
 
     return list(watchlists_dict.values())
 
 
-def fetch_user_watchlists_summary(user_id: int, db: Session):
-    """Lightweight fetch for search page - just IDs and names + product membership"""
-    from sqlalchemy.sql import text
+async def fetch_user_watchlists_with_prices_async(user_id: int, db: AsyncSession, user_verified: bool = False):
+    """
+    Fetch user watchlists with latest price data for each product
+    user_verified: the caller already knows the user exists (access token, version lookup), skip the check
+    """
+    if not user_verified:
+        user = await db.get(User, user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
 
-    # Verify user exists
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    rows = (await db.execute(text(WATCHLISTS_WITH_PRICES_SQL), {"user_id": user_id})).fetchall()
+    return group_watchlist_rows(rows)
 
-    # Get all watchlists with product IDs (no price data)
-    sql = """
-        SELECT
-            w.id as watchlist_id,
-            w.name as watchlist_name,
-            COALESCE(
-                array_agg(wp.product_id) FILTER (WHERE wp.product_id IS NOT NULL),
-                ARRAY[]::integer[]
-            ) as product_ids
-        FROM watchlists w
-        LEFT JOIN watchlist_products wp ON w.id = wp.watchlist_id
-        WHERE w.user_id = :user_id
-        GROUP BY w.id, w.name
-        ORDER BY w.id
-    """
 
-    rows = db.execute(text(sql), {"user_id": user_id}).fetchall()
+# Get all watchlists with product IDs (no price data)
+# watchlists_version comes from the same snapshot as the watchlists, it's what the cached summary is stamped with.
+# One row with a null watchlist_id for a user without watchlists, no row for an unknown user.
+WATCHLISTS_SUMMARY_SQL = """
+    SELECT
+        u.watchlists_version,
+        w.id as watchlist_id,
+        w.name as watchlist_name,
+        COALESCE(
+            array_agg(wp.product_id) FILTER (WHERE wp.product_id IS NOT NULL),
+            ARRAY[]::integer[]
+        ) as product_ids
+    FROM users u
+    LEFT JOIN watchlists w ON w.user_id = u.id
+    LEFT JOIN watchlist_products wp ON w.id = wp.watchlist_id
+    WHERE u.id = :user_id
+    GROUP BY u.watchlists_version, w.id, w.name
+    ORDER BY w.id
+"""
+
 
+def summary_rows_to_watchlists(rows) -> list:
     watchlists = []
     for row in rows:
+        if row.watchlist_id is None:
+            continue
         watchlists.append(
             {
                 "id": row.watchlist_id,
@@ -174,29 +368,54 @@ def fetch_user_watchlists_summary(user_id: int, db: Session):
     return watchlists
 
 
-def get_products_watchlist_status(user_id: int, product_ids: List[int], db: Session):
-    """Get which watchlists contain specific products"""
-    from sqlalchemy.sql import text
+async def fetch_user_watchlists_summary_async(user_id: int, db: AsyncSession, watchlists_version: int | None = None):
+    """
+    Lightweight fetch for search page - just IDs and names + product membership
+    With watchlists_version (read by the caller for its ETag) it's served from the watchlist cache. A miss is
+    cached under the version read together with the summary, a change committed in between can be newer
+    than the caller's.
+    """
+    if watchlists_version is not None:
+        cached = await watchlist_cache.get(user_id, watchlists_version)
+        if cached is not None:
+            return cached
 
-    if not product_ids:
-        return {}
+    rows = (await db.execute(text(WATCHLISTS_SUMMARY_SQL), {"user_id": user_id})).fetchall()
+    if not rows:
+        raise HTTPException(status_code=404, detail="User not found")
+    watchlists = summary_rows_to_watchlists(rows)
+    await watchlist_cache.put(user_id, rows[0].watchlists_version, watchlists)
+    return watchlists
 
-    # Convert product_ids to a format suitable for SQL IN clause
-    product_ids_str = ",".join(map(str, product_ids))
 
-    sql = f"""
-        SELECT
-            wp.product_id,
-            array_agg(w.id) as watchlist_ids
-        FROM watchlist_products wp
-        JOIN watchlists w ON wp.watchlist_id = w.id
-        WHERE w.user_id = :user_id
-        AND wp.product_id IN ({product_ids_str})
-        GROUP BY wp.product_id
-    """
+WATCHLIST_STATUS_SQL = """
+    SELECT
+        wp.product_id,
+        array_agg(w.id ORDER BY w.id) as watchlist_ids
+    FROM watchlist_products wp
+    JOIN watchlists w ON wp.watchlist_id = w.id
+    WHERE w.user_id = :user_id
+    AND wp.product_id = ANY(:product_ids)
+    GROUP BY wp.product_id
+"""
+
 
-    rows = db.execute(text(sql), {"user_id": user_id}).fetchall()
+def watchlist_ids_column(product_id_expr: str) -> str:
+    """Same membership as a select column, for search results of a signed in user"""
+    return f"""
+    COALESCE(
+        (
+            SELECT array_agg(w.id ORDER BY w.id)
+            FROM watchlist_products wp
+            JOIN watchlists w ON wp.watchlist_id = w.id
+            WHERE wp.product_id = {product_id_expr}
+              AND w.user_id = :user_id
+        ),
+        ARRAY[]::integer[]
+    ) AS watchlist_ids"""
 
+
+def watchlist_status_rows_to_mapping(rows, product_ids: List[int]) -> dict:
     # Create mapping of product_id -> [watchlist_ids]
     result = {}
     for row in rows:
@@ -210,12 +429,19 @@ def get_products_watchlist_status(user_id: int, product_ids: List[int], db: Sess
     return result
 
 
-def fetch_user_watchlist_products(
-    user_id: int, watchlist_id: int, db: Session, limit: int = 20, offset: int = 0
-) -> tuple[Watchlist, List[Product], bool]:
-    """for detailed watchlist view"""
-    from sqlalchemy.sql import text
+async def get_products_watchlist_status_async(user_id: int, product_ids: List[int], db: AsyncSession):
+    """Get which watchlists contain specific products"""
+    if not product_ids:
+        return {}
+
+    params = {"user_id": user_id, "product_ids": list(product_ids)}
+    rows = (await db.execute(text(WATCHLIST_STATUS_SQL), params)).fetchall()
+    return watchlist_status_rows_to_mapping(rows, product_ids)
+
 
+def build_watchlist_products_query(
+    user_id: int, watchlist_id: int, limit: int, offset: int, cursor: str | None
+) -> tuple[str, dict]:
     sql = """
         SELECT
             p.id,
@@ -231,30 +457,15 @@ def fetch_user_watchlist_products(
             ph.sale_tag,
             ph.discounted_price_per_kg,
             ph.discount_percentage,
-            ph.created_at AS price_created_at
+            ph.created_at AS price_created_at,
+            ph.last_seen_at AS price_last_seen_at
         FROM watchlists w
         JOIN watchlist_products wp ON w.id = wp.watchlist_id
         JOIN products p ON wp.product_id = p.id
         JOIN shops s ON p.shop_id = s.id
-        LEFT JOIN LATERAL (
-            SELECT
-                regular_price,
-                discounted_price,
-                price_per_kg,
-                discounted_price_per_kg,
-                discount_percentage,
-                sale_tag,
-                created_at
-            FROM price_history
-            WHERE product_id = p.id
-            ORDER BY created_at DESC
-            LIMIT 1
-        ) ph ON true
+        LEFT JOIN product_latest_price ph ON ph.product_id = p.id
         WHERE w.user_id = :user_id
-        AND w.id = :watchlist_id
-        ORDER BY ph.discounted_price DESC NULLS LAST
-        LIMIT :limit OFFSET :offset
-    """
+        AND w.id = :watchlist_id"""
 
     params = {
         "user_id": user_id,
@@ -262,70 +473,266 @@ def fetch_user_watchlist_products(
         "limit": limit + 1,
         "offset": offset,
     }
+    if cursor:
+        cursor_key, params["cursor_id"] = decode_cursor(cursor, int)
+        after_key, after_null = keyset_condition("ph.discounted_price", "p.id")
+        sql += after_null if cursor_key is None else after_key
+        params["cursor_key"] = cursor_key
+        params["offset"] = 0
+    sql += """
+        ORDER BY ph.discounted_price DESC NULLS LAST, p.id DESC
+        LIMIT :limit OFFSET :offset
+    """
+    return sql, params
+
+
+def watchlist_product_rows_to_page(rows, limit: int) -> tuple[list, bool, str | None]:
+    has_more = len(rows) > limit
+    products = [product_row_to_dict(row) for row in rows[:limit]]
+    next_cursor = encode_cursor(rows[limit - 1].discounted_price, rows[limit - 1].id) if has_more else None
+    return products, has_more, next_cursor
+
 
-    watchlist = db.query(Watchlist).filter(Watchlist.id == watchlist_id, Watchlist.user_id == user_id).first()
+async def fetch_user_watchlist_products_async(
+    user_id: int, watchlist_id: int, db: AsyncSession, limit: int = 20, offset: int = 0, cursor: str | None = None
+) -> tuple[Watchlist, List[Product], bool, str | None]:
+    """for detailed watchlist view. Pass the returned cursor back to get the next page (offset is then ignored)"""
+    sql, params = build_watchlist_products_query(user_id, watchlist_id, limit, offset, cursor)
+
+    watchlist = (
+        await db.execute(select(Watchlist).where(Watchlist.id == watchlist_id, Watchlist.user_id == user_id))
+    ).scalar_one_or_none()
 
     if not watchlist:
         raise HTTPException(status_code=404, detail="Watchlist not found")
 
-    rows = db.execute(text(sql), params).fetchall()
-    has_more = len(rows) > limit
+    rows = (await db.execute(text(sql), params)).fetchall()
+    products, has_more, next_cursor = watchlist_product_rows_to_page(rows, limit)
+    return (watchlist, products, has_more, next_cursor)
+
+
+# every shop's product of the group, cheapest first. Products that were never matched compare only with themselves
+PRODUCT_COMPARISON_SQL = """
+    SELECT
+        p.id,
+        p.name,
+        p.link,
+        p.img_thumbnail_src,
+        p.img_full_src,
+        p.shop_id,
+        s.name AS shop_name,
+        lp.regular_price,
+        lp.discounted_price,
+        lp.price_per_kg,
+        lp.discounted_price_per_kg,
+        lp.sale_tag,
+        lp.discount_percentage,
+        lp.created_at AS price_created_at,
+        lp.last_seen_at AS price_last_seen_at,
+        g.group_id
+    FROM products p
+    JOIN shops s ON p.shop_id = s.id
+    LEFT JOIN product_latest_price lp ON lp.product_id = p.id
+    LEFT JOIN product_groups g ON g.product_id = p.id
+    WHERE p.id IN (
+        SELECT CAST(:product_id AS integer)
+        UNION
+        SELECT member.product_id
+        FROM product_groups own
+        JOIN product_groups member ON member.group_id = own.group_id
+        WHERE own.product_id = :product_id
+    )
+    ORDER BY COALESCE(lp.discounted_price, lp.regular_price) ASC NULLS LAST, p.shop_id
+"""
+
+
+async def fetch_product_comparison_async(product_id: int, db: AsyncSession):
+    """Latest price of the same product in every shop (groups from scripts/match_products.py)"""
+    rows = (await db.execute(text(PRODUCT_COMPARISON_SQL), {"product_id": product_id})).fetchall()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    return {
+        "product_id": product_id,
+        "group_id": rows[0].group_id,
+        "products": [product_row_to_dict(row) for row in rows],
+    }
+
+
+HISTORY_BUCKETS = ("day", "week", "month")
+HISTORY_MAX_POINTS = int(os.environ.get("HISTORY_MAX_POINTS", "500"))
+# without ?from= the history starts max_points buckets back, price_history is partitioned by month
+HISTORY_BUCKET_SPANS = {"day": timedelta(days=1), "week": timedelta(weeks=1), "month": timedelta(days=31)}
+# how far before ?from= a superseded price may have started and still be drawn from ?from= on
+HISTORY_CARRY_IN_DAYS = int(os.environ.get("HISTORY_CARRY_IN_DAYS", "90"))
+
+# one row per bucket, aggregated in postgres, newest buckets first so the cap keeps the recent ones.
+# Rows are price intervals [created_at, last_seen_at]: every interval is spread over the buckets it covers,
+# plus the interval that was current at date_from. That one is the current price (product_latest_price, no
+# price_history probe) when it started before date_from, else the newest row in the carry_from..date_from
+# window. Both branches are bounded on created_at, so only the partitions from carry_from on are scanned.
+PRICE_HISTORY_BUCKETS_SQL = """
+    WITH carry_in AS (
+        SELECT created_at, last_seen_at, regular_price, discounted_price
+        FROM (
+            SELECT lp.created_at, lp.last_seen_at, lp.regular_price, lp.discounted_price
+            FROM product_latest_price lp
+            WHERE lp.product_id = :product_id
+              AND lp.created_at < :date_from
+            UNION ALL
+            (
+                SELECT ph.created_at, ph.last_seen_at, ph.regular_price, ph.discounted_price
+                FROM price_history ph
+                WHERE ph.product_id = :product_id
+                  AND ph.created_at < :date_from
+                  AND ph.created_at >= :carry_from
+                ORDER BY ph.created_at DESC
+                LIMIT 1
+            )
+        ) candidates
+        ORDER BY created_at DESC
+        LIMIT 1
+    ),
+    intervals AS (
+        SELECT * FROM carry_in
+        UNION ALL
+        SELECT ph.created_at, ph.last_seen_at, ph.regular_price, ph.discounted_price
+        FROM price_history ph
+        WHERE ph.product_id = :product_id
+          AND ph.created_at >= :date_from
+          {upper_filter}
+    )
+    SELECT
+        buckets.bucket_start,
+        MIN(COALESCE(i.discounted_price, i.regular_price)) AS min_price,
+        MAX(COALESCE(i.discounted_price, i.regular_price)) AS max_price,
+        (array_agg(COALESCE(i.discounted_price, i.regular_price) ORDER BY i.created_at DESC))[1] AS last_price,
+        (array_agg(i.regular_price ORDER BY i.created_at DESC))[1] AS last_regular_price,
+        COUNT(*) AS samples
+    FROM intervals i
+    CROSS JOIN LATERAL generate_series(
+        date_trunc('{bucket}', GREATEST(i.created_at, :date_from)),
+        date_trunc('{bucket}', COALESCE(i.last_seen_at, i.created_at)),
+        interval '1 {bucket}'
+    ) AS buckets(bucket_start)
+    {bucket_filter}
+    GROUP BY 1
+    ORDER BY 1 DESC
+    LIMIT :limit
+"""
+
+
+def naive_utc(value: datetime) -> datetime:
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+
+def build_price_history_query(bucket: str, bounded_above: bool) -> str:
+    if bucket not in HISTORY_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {', '.join(HISTORY_BUCKETS)}")
+    return PRICE_HISTORY_BUCKETS_SQL.format(
+        bucket=bucket,
+        upper_filter="AND ph.created_at < :date_to" if bounded_above else "",
+        bucket_filter="WHERE buckets.bucket_start < :date_to" if bounded_above else "",
+    )
+
+
+async def fetch_product_history_async(
+    product_id: int, db: AsyncSession, bucket: str = "day", date_from=None, date_to=None, max_points: int = 365
+):
+    """
+    Price history of a product downsampled to day/week/month buckets (min, max, last price of the intervals in each).
+    date_from defaults to max_points buckets before date_to (or now).
+    Returns:
+        dict: product fields + points oldest first, truncated=True when older buckets were cut by max_points
+    """
+    if date_from is not None and date_to is not None and date_from >= date_to:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    max_points = min(max_points, HISTORY_MAX_POINTS)
+
+    product = await db.get(Product, product_id)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    params = {"product_id": product_id, "limit": max_points + 1}
+    # created_at is a naive TIMESTAMP (server time, UTC), asyncpg refuses aware datetimes for it
+    if date_to is not None:
+        params["date_to"] = naive_utc(date_to)
+    if date_from is not None:
+        params["date_from"] = naive_utc(date_from)
+    else:
+        # always bound the range so only the partitions of the requested months are scanned
+        end = params.get("date_to") or naive_utc(datetime.now(timezone.utc))
+        params["date_from"] = end - HISTORY_BUCKET_SPANS[bucket] * max_points
+    params["carry_from"] = params["date_from"] - timedelta(days=HISTORY_CARRY_IN_DAYS)
+    rows = (await db.execute(text(build_price_history_query(bucket, date_to is not None)), params)).fetchall()
 
-    products = []
-    for row in rows[:limit]:
-        product = {
+    truncated = len(rows) > max_points
+    points = [
+        {
+            "bucket_start": row.bucket_start,
+            "min_price": convert_to_decimal(row.min_price),
+            "max_price": convert_to_decimal(row.max_price),
+            "last_price": convert_to_decimal(row.last_price),
+            "last_regular_price": convert_to_decimal(row.last_regular_price),
+            "samples": row.samples,
+        }
+        for row in reversed(rows[:max_points])
+    ]
+    return {
+        "id": product.id,
+        "name": product.name,
+        "link": product.link,
+        "img_thumbnail_src": product.img_thumbnail_src,
+        "img_full_src": product.img_full_src,
+        "shop_id": product.shop_id,
+        "bucket": bucket,
+        "points": points,
+        "truncated": truncated,
+    }
+
+
+# price_alerts is an outbox written by ingest, a poll is one index range scan on (user_id, id)
+PRICE_ALERTS_SQL = """
+    SELECT
+        a.id, a.product_id, a.old_price, a.new_price, a.created_at,
+        p.name, p.link, p.img_thumbnail_src, p.shop_id, s.name AS shop_name
+    FROM price_alerts a
+    JOIN products p ON p.id = a.product_id
+    JOIN shops s ON s.id = p.shop_id
+    WHERE a.user_id = :user_id
+      AND a.id > :after
+    ORDER BY a.id
+    LIMIT :limit
+"""
+
+
+async def fetch_price_alerts_async(user_id: int, db: AsyncSession, after: int = 0, limit: int = 50):
+    """
+    Price drops on the user's watched products, oldest first, newer than the alert id `after`.
+    No user lookup, an unknown user simply has no alerts.
+    Returns:
+        dict: alerts, has_more, next_after (pass as `after` on the next poll)
+    """
+    rows = (
+        await db.execute(text(PRICE_ALERTS_SQL), {"user_id": user_id, "after": after, "limit": limit + 1})
+    ).fetchall()
+    has_more = len(rows) > limit
+    alerts = [
+        {
             "id": row.id,
+            "product_id": row.product_id,
             "name": row.name,
             "link": row.link,
             "img_thumbnail_src": row.img_thumbnail_src,
-            "img_full_src": row.img_full_src,
             "shop_id": row.shop_id,
             "shop_name": row.shop_name,
-            "price_history": {
-                "regular_price": convert_to_decimal(row.regular_price),
-                "discounted_price": convert_to_decimal(row.discounted_price),
-                "price_per_kg": convert_to_decimal(row.price_per_kg),
-                "discounted_price_per_kg": convert_to_decimal(row.discounted_price_per_kg),
-                "sale_tag": row.sale_tag,
-                "discount_percentage": row.discount_percentage,
-                "created_at": row.price_created_at,
-            },
-            "last_updated": row.price_created_at,
+            "old_price": convert_to_decimal(row.old_price),
+            "new_price": convert_to_decimal(row.new_price),
+            "created_at": row.created_at,
         }
-        products.append(product)
-
-    return (watchlist, products, has_more)
-
-
-def fetch_user_watchlists(user_id: int, db: Session):
-    user = (
-        db.query(User)
-        .options(joinedload(User.watchlists).joinedload(Watchlist.products))
-        .filter(User.id == user_id)
-        .first()
-    )
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    watchlists_list = []
-    for watchlist in user.watchlists:
-        watchlists_list.append(
-            {
-                "id": watchlist.id,
-                "name": watchlist.name,
-                "products": [
-                    {
-                        "id": product.id,
-                        "name": product.name,
-                        "shop_id": product.shop_id,
-                        "img_thumbnail_src": product.img_thumbnail_src,
-                        "img_full_src": product.img_full_src,
-                        "link": product.link,
-                    }
-                    for product in watchlist.products
-                ],
-            }
-        )
-    return watchlists_list
+        for row in rows[:limit]
+    ]
+    return {"alerts": alerts, "has_more": has_more, "next_after": alerts[-1]["id"] if alerts else after}
 
 
 def normalize_name(name: str) -> str:
@@ -335,19 +742,45 @@ def normalize_name(name: str) -> str:
     return normalized_name[:255]  # avoids exception for when >255 (our db max)
 
 
-def search_for_product(
-    db: Session, user_input: str | None, shop_ids: List[int] | None = [], limit: int = 20, offset: int = 0
-):
+SEARCH_MODES = ("substring", "fuzzy")
 
-    # need this: CREATE EXTENSION IF NOT EXISTS pg_trgm;
-    from sqlalchemy.sql import text
+# pg_trgm word_similarity cut-off for the fuzzy mode (pg default 0.6), lower = more typo tolerant
+FUZZY_WORD_SIMILARITY_THRESHOLD = float(os.environ.get("SEARCH_FUZZY_THRESHOLD", "0.5"))
 
-    if not user_input:
-        logger.info("No input provided — returning empty list")
-        return [], False
+# SET LOCAL equivalent, only lasts for the current transaction
+FUZZY_THRESHOLD_SQL = "SELECT set_config('pg_trgm.word_similarity_threshold', :threshold, true)"
 
-    search_terms = normalize_name(user_input).split()
-    sql = """SELECT
+
+def build_search_query(
+    user_input: str,
+    shop_ids: List[int] | None,
+    limit: int,
+    offset: int,
+    mode: str,
+    cursor: str | None,
+    param_prefix: str = "",
+    user_id: int | None = None,
+) -> tuple[str, dict]:
+    """
+    Args:
+        param_prefix (str): prepended to the per-query parameter names, so several searches fit one statement
+        user_id (int): adds a watchlist_ids column, the user's watchlists containing each product
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode: {mode}")
+
+    normalized_input = normalize_name(user_input)
+    search_terms = normalized_input.split()
+    # keyset sort key, rounded so the value in the cursor compares exactly on the next page.
+    # Substring results: most recently scraped first. Not lp.created_at, with change-only recording that's when
+    # the price last changed, and a delisted product would outrank still listed ones with a stable price.
+    if mode == "fuzzy":
+        sort_expr = f"round(word_similarity(:{param_prefix}query, p.name_normalized)::numeric, 4)"
+        parse_sort_key = Decimal
+    else:
+        sort_expr = "lp.last_seen_at"
+        parse_sort_key = datetime.fromisoformat
+    sql = f"""SELECT
             p.id,
             p.name,
             p.link,
@@ -361,16 +794,12 @@ def search_for_product(
             lp.discounted_price_per_kg,
             lp.sale_tag,
             lp.discount_percentage,
-            lp.created_at AS price_created_at
+            lp.created_at AS price_created_at,
+            lp.last_seen_at AS price_last_seen_at,
+            {sort_expr} AS sort_key
         FROM products p
         JOIN shops s ON p.shop_id = s.id
-        LEFT JOIN LATERAL (
-            SELECT ph.*
-            FROM price_history ph
-            WHERE ph.product_id = p.id
-            ORDER BY ph.created_at DESC
-            LIMIT 1
-        ) lp ON true
+        LEFT JOIN product_latest_price lp ON lp.product_id = p.id
         WHERE
             s.id = ANY(:shop_ids)"""
 
@@ -381,36 +810,220 @@ def search_for_product(
         "offset": offset,
     }
     for i, term in enumerate(search_terms):
-        sql += f" AND p.name_normalized ILIKE :term{i} "
-        params[f"term{i}"] = f"%{term}%"  # through parameter to avoid sql injection
-    sql += """
-    ORDER BY lp.created_at DESC NULLS LAST
+        if mode == "fuzzy":
+            # <% is word_similarity above the threshold, indexable by gin_trgm_ops
+            sql += f" AND :{param_prefix}term{i} <% p.name_normalized "
+            params[f"{param_prefix}term{i}"] = term
+        else:
+            sql += f" AND p.name_normalized ILIKE :{param_prefix}term{i} "
+            params[f"{param_prefix}term{i}"] = f"%{term}%"  # through parameter to avoid sql injection
+    if mode == "fuzzy":
+        params[f"{param_prefix}query"] = normalized_input
+
+    # seek past the previous page instead of counting through it with OFFSET
+    if cursor:
+        cursor_key, params["cursor_id"] = decode_cursor(cursor, parse_sort_key)
+        after_key, after_null = keyset_condition(sort_expr, "p.id")
+        sql += after_null if cursor_key is None else after_key
+        params["cursor_key"] = cursor_key
+        params["offset"] = 0
+
+    sql += f"""
+    ORDER BY {sort_expr} DESC NULLS LAST, p.id DESC
         LIMIT :limit OFFSET :offset"""
 
-    rows = db.execute(text(sql), params).fetchall()
+    if user_id is not None:
+        # the page is cut first, membership is looked up for its rows only
+        sql = f"""SELECT page.*, {watchlist_ids_column("page.id")}
+        FROM ({sql}) page
+        ORDER BY page.sort_key DESC NULLS LAST, page.id DESC"""
+        params["user_id"] = user_id
+    return sql, params
+
+
+# display columns for ids already matched by the in-memory index
+PRODUCTS_BY_IDS_SQL = """
+    SELECT
+        p.id,
+        p.name,
+        p.link,
+        p.img_thumbnail_src,
+        p.img_full_src,
+        p.shop_id,
+        s.name AS shop_name,
+        lp.regular_price,
+        lp.discounted_price,
+        lp.price_per_kg,
+        lp.discounted_price_per_kg,
+        lp.sale_tag,
+        lp.discount_percentage,
+        lp.created_at AS price_created_at,
+        lp.last_seen_at AS price_last_seen_at
+    FROM products p
+    JOIN shops s ON p.shop_id = s.id
+    LEFT JOIN product_latest_price lp ON lp.product_id = p.id
+    WHERE p.id = ANY(:ids)
+"""
+
+PRODUCTS_BY_IDS_WITH_WATCHLISTS_SQL = PRODUCTS_BY_IDS_SQL.replace(
+    "lp.last_seen_at AS price_last_seen_at",
+    "lp.last_seen_at AS price_last_seen_at," + watchlist_ids_column("p.id"),
+)
+
+
+async def search_in_index_async(
+    db: AsyncSession,
+    user_input: str,
+    shop_ids: List[int] | None,
+    limit: int,
+    offset: int,
+    cursor: str | None,
+    user_id: int | None = None,
+):
+    """Substring mode through the in-memory inverted index (SEARCH_BACKEND=memory), same return as the postgres path"""
+    shop_versions = search_cache.shop_versions()
+    if search_index.loaded_versions != shop_versions:
+        await search_index.refresh_async(db, shop_versions, AsyncSessionLocal)
+
+    after_id = decode_cursor(cursor, int)[1] if cursor else None
+    ids, has_more = search_index.search(normalize_name(user_input).split(), shop_ids, limit, offset, after_id)
+    if not ids:
+        return [], False, None
+
+    if user_id is None:
+        result = await db.execute(text(PRODUCTS_BY_IDS_SQL), {"ids": ids})
+    else:
+        result = await db.execute(text(PRODUCTS_BY_IDS_WITH_WATCHLISTS_SQL), {"ids": ids, "user_id": user_id})
+    rows = result.fetchall()
+    rows_by_id = {row.id: row for row in rows}
+    products = [search_row_to_dict(rows_by_id[pid]) for pid in ids if pid in rows_by_id]
+    next_cursor = encode_cursor(ids[-1], ids[-1]) if has_more else None
+    return (products, has_more, next_cursor)
+
 
+def search_row_to_dict(row) -> dict:
+    product = product_row_to_dict(row)
+    if "watchlist_ids" in row._fields:
+        product["watchlist_ids"] = list(row.watchlist_ids)
+    return product
+
+
+def without_watchlist_ids(page):
+    """The user independent part of a page, what goes in the shared search cache"""
+    products, has_more, next_cursor = page
+    products = [{key: value for key, value in product.items() if key != "watchlist_ids"} for product in products]
+    return (products, has_more, next_cursor)
+
+
+def search_rows_to_page(rows, limit: int) -> tuple[list, bool, str | None]:
     has_more = len(rows) > limit
-    products = []
-    for product in rows[:limit]:
-        products.append(
-            {
-                "id": product.id,
-                "name": product.name,
-                "link": product.link,
-                "img_thumbnail_src": product.img_thumbnail_src,
-                "img_full_src": product.img_full_src,
-                "shop_id": product.shop_id,
-                "shop_name": product.shop_name,
-                "price_history": {
-                    "regular_price": convert_to_decimal(product.regular_price),
-                    "discounted_price": convert_to_decimal(product.discounted_price),
-                    "price_per_kg": convert_to_decimal(product.price_per_kg),
-                    "discounted_price_per_kg": convert_to_decimal(product.discounted_price_per_kg),
-                    "sale_tag": product.sale_tag,
-                    "discount_percentage": product.discount_percentage,
-                    "created_at": product.price_created_at,
-                },
-                "last_updated": product.price_created_at,
-            }
-        )
-    return (products, has_more)
+    products = [search_row_to_dict(product) for product in rows[:limit]]
+    next_cursor = encode_cursor(rows[limit - 1].sort_key, rows[limit - 1].id) if has_more else None
+    return (products, has_more, next_cursor)
+
+
+async def search_for_product_async(
+    db: AsyncSession,
+    user_input: str | None,
+    shop_ids: List[int] | None = [],
+    limit: int = 20,
+    offset: int = 0,
+    mode: str = "substring",
+    cursor: str | None = None,
+    user_id: int | None = None,
+):
+    """
+    Search products by name in the selected shops.
+
+    Both modes are served by the trigram GIN index on products.name_normalized
+    (see migrations/0001_trgm_product_search.sql).
+
+    Args:
+        mode (str): "substring" every word must appear in the name, newest prices first.
+                    "fuzzy" every word must roughly appear in the name (typo tolerant),
+                    best matches first.
+        cursor (str): next_cursor of the previous page, offset is ignored when given.
+
+    Returns:
+        tuple(list, bool, str | None): (products, has_more, next_cursor)
+
+    Pages are cached in search_cache until their shops get new data (see scripts/search_cache.py).
+    With SEARCH_BACKEND=memory the substring mode is matched by the in-memory index (see scripts/search_index.py).
+    With user_id every product also gets watchlist_ids, looked up in the search statement itself
+    (or, for a cached page, in the one query the request makes).
+    """
+    if not user_input:
+        logger.info("No input provided — returning empty list")
+        return [], False, None
+
+    await search_cache.refresh_shop_versions_async(db)
+    cache_key = search_cache.make_key(normalize_name(user_input), shop_ids, limit, offset, mode, cursor)
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        if user_id is None:
+            return cached
+        products, has_more, next_cursor = cached
+        membership = await get_products_watchlist_status_async(user_id, [product["id"] for product in products], db)
+        products = [{**product, "watchlist_ids": membership[product["id"]]} for product in products]
+        return (products, has_more, next_cursor)
+
+    if SEARCH_BACKEND == "memory" and mode == "substring":
+        page = await search_in_index_async(db, user_input, shop_ids, limit, offset, cursor, user_id)
+    else:
+        sql, params = build_search_query(user_input, shop_ids, limit, offset, mode, cursor, user_id=user_id)
+        if mode == "fuzzy":
+            await db.execute(text(FUZZY_THRESHOLD_SQL), {"threshold": str(FUZZY_WORD_SIMILARITY_THRESHOLD)})
+
+        rows = (await db.execute(text(sql), params)).fetchall()
+        page = search_rows_to_page(rows, limit)
+    search_cache.put(cache_key, without_watchlist_ids(page) if user_id is not None else page)
+    return page
+
+
+def build_batch_search_query(queries: List[str], shop_ids: List[int] | None, limit: int, mode: str):
+    """
+    One statement for a whole shopping list: every line is the normal search as a UNION ALL branch,
+    so each branch keeps its own index scan + LIMIT.
+
+    Returns:
+        tuple(str | None, dict): (sql or None when no line has words, params)
+    """
+    branches = []
+    params = {}
+    for i, user_input in enumerate(queries):
+        if not normalize_name(user_input).split():
+            continue
+        sql, query_params = build_search_query(user_input, shop_ids, limit, 0, mode, None, param_prefix=f"q{i}_")
+        branches.append(f"SELECT {i} AS query_index, matches.* FROM ({sql}) matches")
+        params.update(query_params)
+
+    if not branches:
+        return None, params
+    sql = "\nUNION ALL\n".join(branches) + "\nORDER BY query_index, sort_key DESC NULLS LAST, id DESC"
+    return sql, params
+
+
+async def search_products_batch_async(
+    db: AsyncSession, queries: List[str], shop_ids: List[int] | None, limit: int = 5, mode: str = "substring"
+):
+    """
+    Top results for every query in a single round trip.
+
+    Returns:
+        list[dict]: one {"query", "products", "has_more"} per query, in request order
+    """
+    results = [{"query": query, "products": [], "has_more": False} for query in queries]
+
+    sql, params = build_batch_search_query(queries, shop_ids, limit, mode)
+    if sql is None:
+        return results
+    if mode == "fuzzy":
+        await db.execute(text(FUZZY_THRESHOLD_SQL), {"threshold": str(FUZZY_WORD_SIMILARITY_THRESHOLD)})
+
+    for row in (await db.execute(text(sql), params)).fetchall():
+        result = results[row.query_index]
+        if len(result["products"]) < limit:
+            result["products"].append(product_row_to_dict(row))
+        else:
+            result["has_more"] = True  # each branch fetches limit + 1 rows
+    return results
@@ -0,0 +1,59 @@
+import hashlib
+
+from fastapi import Request, Response
+
+# Conditional GETs for the mobile app. Data only changes when an ingest bumps shops.data_version
+# (or, for watchlists, when the user edits them and users.watchlists_version is bumped),
+# so the ETag is derived from those stamps and an If-None-Match hit is answered with 304
+# before the real query runs.
+
+SHOPS_CACHE_CONTROL = "public, max-age=300"
+SEARCH_CACHE_CONTROL = "public, max-age=60"
+# watchlists change on user actions, always revalidate (cheap when nothing changed)
+WATCHLIST_CACHE_CONTROL = "private, no-cache"
+# per user responses without a cheap ETag
+PERSONAL_CACHE_CONTROL = "private, no-store"
+
+
+def make_etag(*parts) -> str:
+    """Weak ETag, the same logical content may be re-encoded byte for byte differently"""
+    digest = hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=16).hexdigest()
+    return f'W/"{digest}"'
+
+
+def shop_data_etag(shop_versions: dict[int, int], shop_ids, *parts) -> str:
+    """ETag over the data versions of the given shops (all shops when shop_ids is None)"""
+    shop_ids = sorted(shop_versions) if shop_ids is None else sorted(set(shop_ids))
+    return make_etag(tuple((shop_id, shop_versions.get(shop_id, 0)) for shop_id in shop_ids), *parts)
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # weak comparison: W/"x" and "x" are the same tag
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+def with_cache_headers(result, response: Response, etag: str, cache_control: str):
+    """
+    Adds ETag + Cache-Control to what the route returns.
+    A returned Response (fast_json) ignores the injected `response` parameter, so it gets the headers itself.
+    """
+    target = result if isinstance(result, Response) else response
+    target.headers["ETag"] = etag
+    target.headers["Cache-Control"] = cache_control
+    return result
+
+
+def without_caching(result, response: Response):
+    target = result if isinstance(result, Response) else response
+    target.headers["Cache-Control"] = PERSONAL_CACHE_CONTROL
+    return result
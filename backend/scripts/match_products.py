@@ -0,0 +1,305 @@
+import hashlib
+import io
+import random
+import re
+import sys
+import time
+import zlib
+from collections import defaultdict
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.sql import text
+
+from data.database import SessionLocal, ProductGroup
+from scripts.logging_config import get_logger
+
+logger = get_logger("match_products.py")
+
+# Offline cross-shop matching: links the same product sold by different shops into product_groups.
+#
+# 1. blocking: products are only compared inside the same size block ("1000ml", "500g", ...)
+# 2. MinHash over the remaining name words + LSH banding finds candidate pairs without comparing every pair
+# 3. candidates from different shops with word Jaccard >= MATCH_THRESHOLD are merged (union-find),
+#    a group never holds two products of the same shop
+#
+# group_id is the smallest product id of the group, unmatched products are stored as their own group
+# so incremental runs (the default, after every ingest) only look at products without a row.
+# The LSH buckets of every product are kept in product_lsh_buckets: an incremental run signs only the new
+# products and probes the stored buckets for their candidates, so it costs O(new products), not O(catalog).
+# --full (or an empty product_lsh_buckets) re-signs the whole catalog and rewrites every bucket and group.
+#
+# Usage: python -m scripts.match_products [--full]
+
+NUM_HASHES = 32
+BANDS = 8  # 8 bands x 4 rows: pairs with ~0.6 similarity collide in at least one band most of the time
+ROWS_PER_BAND = NUM_HASHES // BANDS
+MATCH_THRESHOLD = 0.6
+MAX_BUCKET_SIZE = 200  # buckets this big are generic words ("gala", "1000ml"), they add noise not matches
+
+PRIME = (1 << 61) - 1
+_rng = random.Random(42)  # fixed so signatures are the same every run
+HASH_PARAMS = [(_rng.randrange(1, PRIME), _rng.randrange(0, PRIME)) for _ in range(NUM_HASHES)]
+
+UNIT_FACTORS = {
+    "kg": ("g", 1000),
+    "kilo": ("g", 1000),
+    "gr": ("g", 1),
+    "g": ("g", 1),
+    "lt": ("ml", 1000),
+    "ltr": ("ml", 1000),
+    "l": ("ml", 1000),
+    "ml": ("ml", 1),
+    "tem": ("tem", 1),  # τεμ. (pieces)
+}
+SIZE_PATTERN = re.compile(r"(?:(\d+)\s*x\s*)?(\d+(?:[.,]\d+)?)\s*(kg|kilo|gr|g|ltr|lt|l|ml|tem)\b\.?")
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+PRODUCTS_SQL = "SELECT id, shop_id, name_normalized FROM products WHERE name_normalized IS NOT NULL ORDER BY id"
+
+# products without a product_groups row, what an incremental run places
+NEW_PRODUCTS_SQL = """
+    SELECT p.id, p.shop_id, p.name_normalized
+    FROM products p
+    WHERE p.name_normalized IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM product_groups g WHERE g.product_id = p.id)
+    ORDER BY p.id
+"""
+
+HAS_BUCKETS_SQL = "SELECT EXISTS (SELECT 1 FROM product_lsh_buckets)"
+
+# the stored products sharing a bucket with the new ones, buckets over MAX_BUCKET_SIZE are skipped in sql
+# so a generic bucket doesn't stream thousands of rows
+BUCKET_MEMBERS_SQL = """
+    SELECT b.bucket, b.product_id, p.shop_id, p.name_normalized
+    FROM product_lsh_buckets b
+    JOIN products p ON p.id = b.product_id
+    WHERE b.bucket IN (
+        SELECT bucket
+        FROM product_lsh_buckets
+        WHERE bucket = ANY(:buckets)
+        GROUP BY bucket
+        HAVING count(*) BETWEEN 2 AND :max_bucket_size
+    )
+      AND p.name_normalized IS NOT NULL
+"""
+
+# every member of the groups the given products are in: merging a group has to see all of its shops,
+# and a new smaller group_id has to be written to all of its rows
+GROUP_MEMBERS_SQL = """
+    SELECT member.product_id, member.group_id, p.shop_id
+    FROM product_groups member
+    JOIN products p ON p.id = member.product_id
+    WHERE member.group_id IN (SELECT group_id FROM product_groups WHERE product_id = ANY(:product_ids))
+"""
+
+DELETE_BUCKETS_SQL = "DELETE FROM product_lsh_buckets WHERE product_id = ANY(:product_ids)"
+
+
+def parse_name(name_normalized: str) -> tuple[str, frozenset]:
+    """
+    Returns:
+        tuple(str, frozenset): (size key like "6x330ml" or "" if none, the remaining name words)
+    """
+    size = ""
+    match = SIZE_PATTERN.search(name_normalized)
+    if match:
+        multiplier, amount, unit = match.groups()
+        base_unit, factor = UNIT_FACTORS[unit]
+        amount = round(float(amount.replace(",", ".")) * factor)
+        size = f"{multiplier}x{amount}{base_unit}" if multiplier else f"{amount}{base_unit}"
+        name_normalized = SIZE_PATTERN.sub(" ", name_normalized)
+    words = frozenset(word for word in WORD_PATTERN.findall(name_normalized) if len(word) > 1)
+    return size, words
+
+
+def minhash(words: frozenset) -> list[int]:
+    hashes = [zlib.crc32(word.encode("utf-8")) for word in words]
+    return [min((a * h + b) % PRIME for h in hashes) for a, b in HASH_PARAMS]
+
+
+def lsh_buckets(size: str, words: frozenset) -> list[int]:
+    """
+    Returns:
+        list[int]: one 64 bit key per band of the MinHash signature, the (size, band, band rows) tuple hashed
+            so it fits product_lsh_buckets.bucket (bigint)
+    """
+    signature = minhash(words)
+    keys = []
+    for band in range(BANDS):
+        key = (size, band, tuple(signature[band * ROWS_PER_BAND : (band + 1) * ROWS_PER_BAND]))
+        digest = hashlib.blake2b(repr(key).encode("utf-8"), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "big", signed=True))
+    return keys
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+class ShopExclusiveUnionFind:
+    """Union-find where every group keeps its shop set, merges that would put 2 products of a shop together are refused"""
+
+    def __init__(self):
+        self.parent: dict[int, int] = {}
+        self.shops: dict[int, set] = {}
+
+    def add(self, product_id: int, shop_id: int):
+        self.parent[product_id] = product_id
+        self.shops[product_id] = {shop_id}
+
+    def find(self, product_id: int) -> int:
+        root = product_id
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[product_id] != root:  # path compression
+            self.parent[product_id], product_id = root, self.parent[product_id]
+        return root
+
+    def union(self, a: int, b: int) -> bool:
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b or self.shops[root_a] & self.shops[root_b]:
+            return False
+        # smallest id becomes the root, so it's also the group_id
+        root, child = min(root_a, root_b), max(root_a, root_b)
+        self.parent[child] = root
+        self.shops[root] |= self.shops.pop(child)
+        return True
+
+
+def candidate_pairs(products: dict, buckets, new_ids: set) -> set[tuple[int, int]]:
+    """LSH: pairs sharing a bucket (member lists), from different shops, at least one of them new"""
+    pairs = set()
+    for members in buckets:
+        if len(members) < 2 or len(members) > MAX_BUCKET_SIZE:
+            continue
+        for i, a in enumerate(members):
+            for b in members[i + 1 :]:
+                if products[a][0] != products[b][0] and (a in new_ids or b in new_ids):
+                    pairs.add((min(a, b), max(a, b)))
+    return pairs
+
+
+def store_buckets(db, product_buckets: dict, full: bool):
+    """Replaces the stored buckets of the given products (all of them when full), COPY like the ingest staging"""
+    if full:
+        db.execute(text("TRUNCATE product_lsh_buckets"))
+    else:
+        db.execute(text(DELETE_BUCKETS_SQL), {"product_ids": list(product_buckets)})
+
+    buffer = io.StringIO()
+    for product_id, keys in product_buckets.items():
+        for key in keys:
+            buffer.write(f"{key}\t{product_id}\n")
+    buffer.seek(0)
+    # raw psycopg2 cursor on the session's connection, so COPY is part of the matching transaction
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert("COPY product_lsh_buckets (bucket, product_id) FROM STDIN", buffer)
+    finally:
+        cursor.close()
+
+
+def match_products(db, full: bool = False) -> dict:
+    """
+    Args:
+        full (bool): recompute every group instead of only placing products without a product_groups row
+    Returns:
+        dict: counters of the run
+    """
+    started = time.time()
+    if not full and not db.execute(text(HAS_BUCKETS_SQL)).scalar_one():
+        logger.info("No stored LSH buckets yet, running a full match.")
+        full = True
+
+    # product id -> (shop id, size key, name words): the new products, then the candidates they are compared to
+    products = {}
+    for row in db.execute(text(PRODUCTS_SQL if full else NEW_PRODUCTS_SQL)):
+        size, words = parse_name(row.name_normalized)
+        products[row.id] = (row.shop_id, size, words)
+    new_ids = set(products)
+    if not new_ids:
+        logger.info("No unmatched products.")
+        return {"products": 0, "new": 0, "pairs": 0, "merged": 0, "written": 0}
+
+    product_buckets = {
+        product_id: lsh_buckets(size, words) for product_id, (_, size, words) in products.items() if words
+    }
+    store_buckets(db, product_buckets, full)
+
+    buckets = defaultdict(list)
+    if full:
+        for product_id, keys in product_buckets.items():
+            for key in keys:
+                buckets[key].append(product_id)
+    else:
+        probe = {key for keys in product_buckets.values() for key in keys}
+        members = db.execute(text(BUCKET_MEMBERS_SQL), {"buckets": list(probe), "max_bucket_size": MAX_BUCKET_SIZE})
+        for row in members:
+            buckets[row.bucket].append(row.product_id)
+            if row.product_id not in products:
+                size, words = parse_name(row.name_normalized)
+                products[row.product_id] = (row.shop_id, size, words)
+
+    groups = ShopExclusiveUnionFind()
+    for product_id, (shop_id, _, _) in products.items():
+        groups.add(product_id, shop_id)
+
+    existing = {}
+    if not full:
+        for row in db.execute(text(GROUP_MEMBERS_SQL), {"product_ids": list(products)}):
+            existing[row.product_id] = row.group_id
+            if row.product_id not in groups.parent:
+                groups.add(row.product_id, row.shop_id)
+        for product_id, group_id in existing.items():
+            if group_id in groups.parent and group_id != product_id:
+                groups.union(group_id, product_id)
+
+    # best matches first, so a product joins its closest group before the shop slot is taken
+    scored = []
+    for a, b in candidate_pairs(products, buckets.values(), new_ids):
+        score = jaccard(products[a][2], products[b][2])
+        if score >= MATCH_THRESHOLD:
+            scored.append((score, a, b))
+    scored.sort(reverse=True)
+    merged = sum(groups.union(a, b) for _, a, b in scored)
+
+    rows = []
+    for product_id in groups.parent:
+        group_id = groups.find(product_id)
+        if existing.get(product_id) != group_id:
+            rows.append({"product_id": product_id, "group_id": group_id})
+
+    if rows:
+        stmt = pg_insert(ProductGroup)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ProductGroup.product_id],
+            set_={"group_id": stmt.excluded.group_id, "matched_at": stmt.excluded.matched_at},
+        )
+        db.execute(stmt, rows)
+    db.commit()
+
+    counters = {
+        "products": len(products),
+        "new": len(new_ids),
+        "pairs": len(scored),
+        "merged": merged,
+        "written": len(rows),
+        "seconds": round(time.time() - started, 1),
+    }
+    logger.info(f"Matching finished: {counters}")
+    return counters
+
+
+def match_new_products(full: bool = False):
+    db = SessionLocal()
+    try:
+        return match_products(db, full=full)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    match_new_products(full="--full" in sys.argv[1:])
@@ -0,0 +1,187 @@
+import argparse
+import re
+from pathlib import Path
+
+from sqlalchemy.sql import text
+
+from data.database import Base, get_engine
+from scripts.logging_config import get_logger
+
+logger = get_logger("migrate.py")
+
+# Versioned schema migrations. Nothing creates tables on import any more: run this before starting the api
+# or the scrapers after a deploy.
+#   an empty database is built from the models (create_all, with the pg_trgm extension and the first
+#   price_history partitions) and every migration is recorded as applied, the models are the latest schema
+#   otherwise the migrations/*.sql not yet in schema_migrations run in file name order
+#
+# Usage:
+#   python -m scripts.migrate                  apply what's pending
+#   python -m scripts.migrate status
+#   python -m scripts.migrate baseline 0010    database from before schema_migrations: record 0001..0010 as
+#                                              applied without running them
+#   python -m scripts.migrate baseline none    database from before migration 0001: adopt it with nothing
+#                                              applied, the next upgrade runs them all
+#   python -m scripts.migrate upgrade --adopt none
+#                                              same adoption, only when the database has tables but no
+#                                              history yet, then the upgrade. What the scrape workflow runs,
+#                                              the production database predates schema_migrations
+#
+# Migration files manage their own BEGIN/COMMIT (some build indexes CONCURRENTLY, which can't run in a
+# transaction block), so they are split into statements and sent one by one on an autocommit connection.
+# A multi-statement query string would run as one implicit transaction.
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "migrations"
+# pg_advisory_lock key, two deploys starting at once don't migrate twice
+MIGRATION_LOCK_ID = 4_731_002
+
+# recorded by `baseline none`, marks a database adopted at version 0
+BASELINE_VERSION = "0000_baseline"
+
+# what the statement splitter has to step over: comments, quoted strings / identifiers, $tag$ bodies
+SQL_TOKEN_PATTERN = re.compile(
+    r"--[^\n]*|/\*.*?\*/|'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|(\$[A-Za-z_0-9]*\$).*?\1|;", re.DOTALL
+)
+
+CREATE_SCHEMA_MIGRATIONS_SQL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version varchar(255) PRIMARY KEY,
+        applied_at timestamp NOT NULL DEFAULT now()
+    )
+"""
+
+
+def available_migrations() -> list[tuple[str, Path]]:
+    """(version, path) in order, the version is the file name without .sql (0010_price_alerts)"""
+    return [(path.stem, path) for path in sorted(MIGRATIONS_DIR.glob("*.sql"))]
+
+
+def applied_versions(connection) -> set[str]:
+    return set(connection.execute(text("SELECT version FROM schema_migrations")).scalars())
+
+
+def record_versions(connection, versions: list[str]):
+    if versions:
+        connection.execute(
+            text("INSERT INTO schema_migrations (version) VALUES (:version) ON CONFLICT DO NOTHING"),
+            [{"version": version} for version in versions],
+        )
+
+
+def is_empty_database(connection) -> bool:
+    return connection.execute(text("SELECT to_regclass('users') IS NULL")).scalar_one()
+
+
+def strip_comments(sql: str) -> str:
+    return SQL_TOKEN_PATTERN.sub(lambda match: "" if match.group(0).startswith(("--", "/*")) else match.group(0), sql)
+
+
+def split_statements(sql: str) -> list[str]:
+    """Splits a migration file on the semicolons outside comments, strings and dollar quoted bodies"""
+    statements = []
+    start = 0
+    for match in SQL_TOKEN_PATTERN.finditer(sql):
+        if match.group(0) == ";":
+            statements.append(sql[start : match.start()])
+            start = match.end()
+    statements.append(sql[start:])
+    # drop the pieces that are only comments / whitespace
+    return [statement.strip() for statement in statements if strip_comments(statement).strip()]
+
+
+def run_migration_file(connection, path: Path):
+    # raw DBAPI cursor on the autocommit connection, the file's own BEGIN / COMMIT delimit its transactions
+    cursor = connection.connection.cursor()
+    try:
+        for statement in split_statements(path.read_text(encoding="utf-8")):
+            cursor.execute(statement)
+    except Exception:
+        cursor.execute("ROLLBACK")  # leave no transaction block of the file open
+        raise
+    finally:
+        cursor.close()
+
+
+def upgrade(connection, adopt: str | None = None) -> list[str]:
+    """
+    Args:
+        adopt (str): baseline (a version or "none") recorded first when the database has tables but no history
+    Returns:
+        list[str]: versions applied by this run
+    """
+    connection.execute(text(CREATE_SCHEMA_MIGRATIONS_SQL))
+    applied = applied_versions(connection)
+    migrations = available_migrations()
+
+    if not applied and not is_empty_database(connection):
+        if adopt is None:
+            raise RuntimeError(
+                "The database has tables but no schema_migrations history, "
+                "record what it already has with: python -m scripts.migrate baseline <version | none>"
+            )
+        applied = set(baseline(connection, adopt))
+        logger.info(f"Adopted the database at baseline {adopt}")
+
+    if not applied:
+        Base.metadata.create_all(connection)
+        record_versions(connection, [version for version, _ in migrations])
+        logger.info(f"Created the schema from the models, recorded {len(migrations)} migrations as applied")
+        return []
+
+    pending = [(version, path) for version, path in migrations if version not in applied]
+    for version, path in pending:
+        logger.info(f"Applying {path.name}")
+        run_migration_file(connection, path)
+        record_versions(connection, [version])
+    return [version for version, _ in pending]
+
+
+def baseline(connection, up_to: str) -> list[str]:
+    """
+    Records the migrations up to the given number (0010 or 0010_price_alerts) as applied, without running them.
+    up_to="none" adopts the database with no migration applied.
+    """
+    connection.execute(text(CREATE_SCHEMA_MIGRATIONS_SQL))
+    if up_to == "none":
+        versions = [BASELINE_VERSION]
+    else:
+        number = up_to.split("_")[0]
+        versions = [version for version, _ in available_migrations() if version.split("_")[0] <= number]
+        if not versions:
+            raise ValueError(f"No migration up to {up_to}, use `none` for a database from before 0001")
+    record_versions(connection, versions)
+    return versions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create / upgrade the database schema")
+    actions = parser.add_subparsers(dest="action")
+    upgrade_parser = actions.add_parser("upgrade")
+    upgrade_parser.add_argument("--adopt", metavar="VERSION", help="baseline for a database without history, or none")
+    actions.add_parser("status")
+    baseline_parser = actions.add_parser("baseline")
+    baseline_parser.add_argument("version", help="last migration the database already has, e.g. 0010, or none")
+    args = parser.parse_args()
+
+    with get_engine().connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_ID})
+        try:
+            match args.action:
+                case "status":
+                    connection.execute(text(CREATE_SCHEMA_MIGRATIONS_SQL))
+                    applied = applied_versions(connection)
+                    for version, _ in available_migrations():
+                        print(f"{'applied' if version in applied else 'pending':8} {version}")
+                case "baseline":
+                    versions = baseline(connection, args.version)
+                    logger.info(f"Recorded {len(versions)} migrations as applied")
+                case _:
+                    applied = upgrade(connection, getattr(args, "adopt", None))
+                    logger.info(f"Applied {len(applied)} migrations" if applied else "Schema is up to date")
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_ID})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+import scripts.helper as helper
+from scripts.logging_config import get_logger
+
+logger = get_logger("password_pool.py")
+
+# bcrypt takes ~100 ms+ of cpu per call. Run inline in an async handler it stalls every request of the worker,
+# so login / sign up hash on a small thread pool (bcrypt releases the GIL while hashing).
+# The pool is bounded: past PASSWORD_QUEUE_LIMIT jobs waiting or running, new ones are refused with a 503
+# right away instead of queueing for seconds behind a login burst.
+#   PASSWORD_WORKERS (2)  PASSWORD_QUEUE_LIMIT (32)  BCRYPT_ROUNDS (12, see helper.hash_password)
+
+
+class PasswordPool:
+    def __init__(self, workers: int, queue_limit: int):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.shed = 0
+
+    def _reserve(self):
+        with self._lock:
+            if self.in_flight >= self.queue_limit:
+                self.shed += 1
+                raise HTTPException(status_code=503, detail="Server busy, try again", headers={"Retry-After": "1"})
+            self.in_flight += 1
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+
+    async def run(self, func, *args):
+        self._reserve()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self._release()
+
+    async def hash_password(self, plain_password: str) -> str:
+        return await self.run(helper.hash_password, plain_password)
+
+    async def verify_password(self, plain_password: str, hashed_password: str) -> bool:
+        return await self.run(helper.verify_password, plain_password, hashed_password)
+
+    async def rehash_if_needed(self, plain_password: str, hashed_password: str) -> str | None:
+        """
+        After a successful login: a new hash when BCRYPT_ROUNDS changed since this one was made.
+        Returns None when it's current, or when the pool is busy (next login tries again).
+        """
+        if not helper.password_needs_rehash(hashed_password):
+            return None
+        try:
+            return await self.hash_password(plain_password)
+        except HTTPException:
+            return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_limit": self.queue_limit,
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+                "shed": self.shed,
+                "bcrypt_rounds": helper.BCRYPT_ROUNDS,
+            }
+
+
+password_pool = PasswordPool(
+    workers=int(os.environ.get("PASSWORD_WORKERS", "2")),
+    queue_limit=int(os.environ.get("PASSWORD_QUEUE_LIMIT", "32")),
+)
@@ -0,0 +1,57 @@
+import argparse
+
+from data.database import get_engine
+from data.partitions import ensure_partitions, list_partitions, retire_partitions
+from scripts.logging_config import get_logger
+
+logger = get_logger("price_history_partitions.py")
+
+# Maintenance of the monthly price_history partitions (data/partitions.py).
+#
+# Usage:
+#   python -m scripts.price_history_partitions list
+#   python -m scripts.price_history_partitions ensure [--ahead 2]
+#   python -m scripts.price_history_partitions retention --keep-months 24 [--drop]
+#
+# retention detaches the months before the window, the detached tables stay in the database until
+# archived (pg_dump -t price_history_2024_01) and dropped, or pass --drop to drop them right away.
+# A current price whose row starts in a retired month is first copied to the start of the kept window
+# (data/partitions.CARRY_CURRENT_PRICES_SQL), ingest keeps extending it and the history keeps showing it.
+
+
+def prepare_partitions(months_ahead: int = 1) -> list[str]:
+    """Called before ingest so this and next month's rows always have a partition"""
+    with get_engine().begin() as connection:
+        created = ensure_partitions(connection, months_ahead)
+    if created:
+        logger.info(f"Created price_history partitions: {', '.join(created)}")
+    return created
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the monthly price_history partitions")
+    actions = parser.add_subparsers(dest="action", required=True)
+    actions.add_parser("list")
+    ensure_parser = actions.add_parser("ensure")
+    ensure_parser.add_argument("--ahead", type=int, default=1, help="months to create after the current one")
+    retention_parser = actions.add_parser("retention")
+    retention_parser.add_argument("--keep-months", type=int, required=True, help="months kept before the current")
+    retention_parser.add_argument("--drop", action="store_true", help="drop instead of detaching")
+    args = parser.parse_args()
+
+    match args.action:
+        case "list":
+            with get_engine().connect() as connection:
+                for name in list_partitions(connection):
+                    print(name)
+        case "ensure":
+            prepare_partitions(args.ahead)
+        case "retention":
+            with get_engine().begin() as connection:
+                retired = retire_partitions(connection, args.keep_months, drop=args.drop)
+            verb = "Dropped" if args.drop else "Detached"
+            logger.info(f"{verb} {len(retired)} price_history partitions: {', '.join(retired) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
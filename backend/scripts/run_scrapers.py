@@ -5,7 +5,13 @@ from scripts.scrapers.scrape_marketin import scrape_marketin
 from scripts.scrapers.scrape_masoutis import scrape_masoutis
 from scripts.scrapers.scrape_mymarket import scrape_mymarket
 from scripts.scrapers.scrape_sklavenitis import scrape_sklavenitis
-from scripts.scrapers.scraper_helpers import upload_scraped_products
+from scripts.scrapers.scraper_helpers import (
+    PRICE_ALERT_RETENTION_DAYS,
+    prune_price_alerts,
+    upload_scraped_products,
+)
+from scripts.match_products import match_new_products
+from scripts.price_history_partitions import prepare_partitions
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from scripts.logging_config import get_logger
 
@@ -36,6 +42,16 @@ def safe_scrape(scrape_func, shop_name, starting_page=1, max_page=150):
         logger.info(f"Scraper session ended.\n{'-' * 160}")
 
 
+def run_product_matching() -> bool:
+    """Groups the products added by this run with their counterparts in the other shops"""
+    try:
+        match_new_products()
+        return True
+    except Exception as e:
+        print(f"Product matching failed: {e}")
+        return False
+
+
 def test():
     failed = False
     with ThreadPoolExecutor(max_workers=6) as executor:
@@ -55,6 +71,9 @@ def test():
                 print(f"A scraper failed: {e}")
                 failed = True
 
+    if not run_product_matching():
+        failed = True
+
     if failed:
         sys.exit(1)
     else:
@@ -80,6 +99,9 @@ def full():
                 print(f"A scraper failed: {e}")
                 failed = True
 
+    if not run_product_matching():
+        failed = True
+
     if failed:
         sys.exit(1)
     else:
@@ -118,6 +140,9 @@ def single_shop(shop_num):
         print(f"{shop_name} scraper failed: {e}")
         sys.exit(1)
 
+    if not run_product_matching():
+        sys.exit(1)
+
 
 def main():
     if len(sys.argv) < 2:
@@ -135,6 +160,11 @@ def main():
         sys.exit(1)
 
     action = sys.argv[1]
+    # once here, not per scraper: the scrapers upload concurrently
+    prepare_partitions()
+    pruned = prune_price_alerts()
+    if pruned:
+        print(f"[run_scrapers][INFO] Pruned {pruned} price alerts older than {PRICE_ALERT_RETENTION_DAYS} days.")
 
     match action:
         case "0":
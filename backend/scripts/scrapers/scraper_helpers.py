@@ -1,7 +1,12 @@
+import hashlib
+import io
+import os
 import sys
 import re
+from sqlalchemy import func, update
 from sqlalchemy.exc import IntegrityError
-from data.database import SessionLocal, Shop, Product, PriceHistory
+from sqlalchemy.sql import text
+from data.database import SessionLocal, Shop
 from unidecode import unidecode
 
 
@@ -94,71 +99,408 @@ def normalize_name(name: str) -> str:
     return unidecode(name).lower().strip()
 
 
-def add_new_offers(db, products: list, shop: Shop) -> tuple[int, int, int, int]:
+# Ingest is set based: the scraped batch is streamed into a temp staging table with COPY, then products
+# are resolved / inserted and prices recorded with a few INSERT ... SELECT / UPDATE ... FROM statements.
+# Everything runs in the caller's transaction, the temp tables are dropped on commit.
+
+STAGING_COLUMNS = (
+    "position",
+    "name",
+    "name_normalized",
+    "link",
+    "img_full_src",
+    "img_thumbnail_src",
+    "regular_price",
+    "discounted_price",
+    "price_per_kg",
+    "discounted_price_per_kg",
+    "discount_percentage",
+    "sale_tag",
+    "content_hash",
+)
+
+CREATE_STAGING_SQL = """
+    CREATE TEMP TABLE ingest_staging (
+        position integer NOT NULL,
+        name text NOT NULL,
+        name_normalized text,
+        link text,
+        img_full_src text,
+        img_thumbnail_src text,
+        regular_price integer,
+        discounted_price integer,
+        price_per_kg integer,
+        discounted_price_per_kg integer,
+        discount_percentage numeric(5, 2),
+        sale_tag text,
+        content_hash text,
+        product_id integer
+    ) ON COMMIT DROP
+"""
+
+# Product identity is (shop_id, link), or (shop_id, name) for products without a link, both backed by
+# unique indexes so a rerun or two racing scrapers can't create duplicates.
+# A linked row that matches no link falls back to the name (RESOLVE_LINKED_BY_NAME_SQL), so a product whose
+# url changed, or that had no link before, keeps its row (history, watchlists) and gets the new link.
+RESOLVE_BY_LINK_SQL = """
+    UPDATE ingest_staging s
+    SET product_id = p.id
+    FROM products p
+    WHERE s.product_id IS NULL
+      AND s.link IS NOT NULL
+      AND p.shop_id = :shop_id
+      AND p.link = s.link
+"""
+
+RESOLVE_BY_NAME_SQL = """
+    UPDATE ingest_staging s
+    SET product_id = p.id
+    FROM products p
+    WHERE s.product_id IS NULL
+      AND s.link IS NULL
+      AND p.shop_id = :shop_id
+      AND p.link IS NULL
+      AND p.name = s.name
+"""
+
+# Only products whose stored link is gone from this batch: a same named product that is still listed under
+# its own link is a different product (another size, another variant).
+RESOLVE_LINKED_BY_NAME_SQL = """
+    UPDATE ingest_staging s
+    SET product_id = p.id
+    FROM products p
+    WHERE s.product_id IS NULL
+      AND s.link IS NOT NULL
+      AND p.shop_id = :shop_id
+      AND p.name = s.name
+      AND (
+          p.link IS NULL
+          OR NOT EXISTS (SELECT 1 FROM ingest_staging listed WHERE listed.link = p.link)
+      )
+"""
+
+# Products seen for the first time, the returned ids go straight back into the staging table.
+# A product listed in more than one category is staged more than once, it's created once (first position).
+# Rows another transaction inserted meanwhile hit DO NOTHING and are picked up by the final resolve.
+INSERT_NEW_PRODUCTS_BY_LINK_SQL = """
+    WITH inserted AS (
+        INSERT INTO products (name, name_normalized, link, img_full_src, img_thumbnail_src, content_hash, shop_id)
+        SELECT DISTINCT ON (s.link)
+            s.name, s.name_normalized, s.link, s.img_full_src, s.img_thumbnail_src, s.content_hash, :shop_id
+        FROM ingest_staging s
+        WHERE s.product_id IS NULL
+          AND s.link IS NOT NULL
+        ORDER BY s.link, s.position
+        ON CONFLICT (shop_id, link) DO NOTHING
+        RETURNING id, link
+    ),
+    staged AS (
+        UPDATE ingest_staging s
+        SET product_id = inserted.id
+        FROM inserted
+        WHERE s.product_id IS NULL
+          AND s.link = inserted.link
+    )
+    SELECT count(*) FROM inserted
+"""
+
+INSERT_NEW_PRODUCTS_BY_NAME_SQL = """
+    WITH inserted AS (
+        INSERT INTO products (name, name_normalized, link, img_full_src, img_thumbnail_src, content_hash, shop_id)
+        SELECT DISTINCT ON (s.name)
+            s.name, s.name_normalized, NULL, s.img_full_src, s.img_thumbnail_src, s.content_hash, :shop_id
+        FROM ingest_staging s
+        WHERE s.product_id IS NULL
+          AND s.link IS NULL
+        ORDER BY s.name, s.position
+        ON CONFLICT (shop_id, name) WHERE link IS NULL DO NOTHING
+        RETURNING id, name
+    ),
+    staged AS (
+        UPDATE ingest_staging s
+        SET product_id = inserted.id
+        FROM inserted
+        WHERE s.product_id IS NULL
+          AND s.link IS NULL
+          AND s.name = inserted.name
+    )
+    SELECT count(*) FROM inserted
+"""
+
+
+# Known products whose scraped name / link / images differ from the stored ones, compared by hash so
+# unchanged rows are never rewritten. One staged row per product (first position) like the prices.
+# A link differs only for rows resolved by name (RESOLVE_LINKED_BY_NAME_SQL: new url, or a first link),
+# that's where the product takes over its new link.
+UPDATE_CHANGED_PRODUCTS_SQL = """
+    UPDATE products p
+    SET name = s.name,
+        name_normalized = s.name_normalized,
+        link = s.link,
+        img_full_src = s.img_full_src,
+        img_thumbnail_src = s.img_thumbnail_src,
+        content_hash = s.content_hash,
+        updated_at = now()
+    FROM (
+        SELECT DISTINCT ON (product_id)
+            product_id, name, name_normalized, link, img_full_src, img_thumbnail_src, content_hash
+        FROM ingest_staging
+        WHERE product_id IS NOT NULL
+        ORDER BY product_id, position
+    ) s
+    WHERE p.id = s.product_id
+      AND p.content_hash IS DISTINCT FROM s.content_hash
+"""
+
+# one price per product (first occurrence), compared once against its current price.
+# The previous price is kept for the price drop alerts.
+STAGE_PRICES_SQL = """
+    CREATE TEMP TABLE ingest_prices ON COMMIT DROP AS
+    SELECT DISTINCT ON (s.product_id)
+        s.product_id, s.regular_price, s.discounted_price, s.price_per_kg,
+        s.discounted_price_per_kg, s.discount_percentage, s.sale_tag,
+        lp.regular_price AS previous_regular_price, lp.discounted_price AS previous_discounted_price,
+        lp.product_id IS NULL
+        OR (lp.regular_price, lp.discounted_price, lp.price_per_kg,
+            lp.discounted_price_per_kg, lp.discount_percentage, lp.sale_tag)
+           IS DISTINCT FROM
+           (s.regular_price, s.discounted_price, s.price_per_kg,
+            s.discounted_price_per_kg, s.discount_percentage, s.sale_tag) AS changed
+    FROM ingest_staging s
+    LEFT JOIN product_latest_price lp ON lp.product_id = s.product_id
+    WHERE s.product_id IS NOT NULL
+    ORDER BY s.product_id, s.position
+"""
+
+INSERT_CHANGED_PRICES_SQL = """
+    INSERT INTO price_history (
+        product_id, regular_price, discounted_price, price_per_kg,
+        discounted_price_per_kg, discount_percentage, sale_tag
+    )
+    SELECT product_id, regular_price, discounted_price, price_per_kg,
+           discounted_price_per_kg, discount_percentage, sale_tag
+    FROM ingest_prices
+    WHERE changed
+"""
+
+# Unchanged prices only extend the current interval. product_latest_price.created_at is the
+# created_at (valid_from) of the product's current price_history row, that pair finds the row to extend.
+EXTEND_UNCHANGED_PRICES_SQL = """
+    WITH seen AS (
+        UPDATE product_latest_price lp
+        SET last_seen_at = now()
+        FROM ingest_prices s
+        WHERE lp.product_id = s.product_id
+          AND NOT s.changed
+        RETURNING lp.product_id, lp.created_at
+    ),
+    extended AS (
+        UPDATE price_history ph
+        SET last_seen_at = now()
+        FROM seen
+        WHERE ph.product_id = seen.product_id
+          AND ph.created_at = seen.created_at
+        RETURNING ph.product_id
+    )
+    SELECT count(*) FROM extended
+"""
+
+# created_at = now() is the same timestamp as the price_history rows inserted in this transaction
+UPSERT_LATEST_PRICES_SQL = """
+    INSERT INTO product_latest_price (
+        product_id, regular_price, discounted_price, price_per_kg,
+        discounted_price_per_kg, discount_percentage, sale_tag, created_at, last_seen_at
+    )
+    SELECT product_id, regular_price, discounted_price, price_per_kg,
+           discounted_price_per_kg, discount_percentage, sale_tag, now(), now()
+    FROM ingest_prices
+    WHERE changed
+    ON CONFLICT (product_id) DO UPDATE SET
+        regular_price = EXCLUDED.regular_price,
+        discounted_price = EXCLUDED.discounted_price,
+        price_per_kg = EXCLUDED.price_per_kg,
+        discounted_price_per_kg = EXCLUDED.discounted_price_per_kg,
+        discount_percentage = EXCLUDED.discount_percentage,
+        sale_tag = EXCLUDED.sale_tag,
+        created_at = EXCLUDED.created_at,
+        last_seen_at = EXCLUDED.last_seen_at
+"""
+
+# Price drop alerts, only the products whose price changed in this ingest are joined against the watchlists
+# (idx_watchlist_products_product_id), so the cost follows the changes and not the number of watchlists.
+# One alert per user and product, even when it's in several of the user's watchlists. New products have no
+# previous price and never alert.
+ENQUEUE_PRICE_ALERTS_SQL = """
+    INSERT INTO price_alerts (user_id, product_id, old_price, new_price)
+    SELECT DISTINCT w.user_id, d.product_id, d.old_price, d.new_price
+    FROM (
+        SELECT product_id,
+               coalesce(previous_discounted_price, previous_regular_price) AS old_price,
+               coalesce(discounted_price, regular_price) AS new_price
+        FROM ingest_prices
+        WHERE changed
+    ) d
+    JOIN watchlist_products wp ON wp.product_id = d.product_id
+    JOIN watchlists w ON w.id = wp.watchlist_id
+    WHERE d.new_price < d.old_price
+"""
+
+# The app polls alerts by id, which ones were seen isn't known here: they are kept PRICE_ALERT_RETENTION_DAYS
+# and pruned before every scraper run (run_scrapers), through idx_price_alerts_created_at
+PRICE_ALERT_RETENTION_DAYS = int(os.environ.get("PRICE_ALERT_RETENTION_DAYS", "30"))
+PRUNE_PRICE_ALERTS_SQL = "DELETE FROM price_alerts WHERE created_at < localtimestamp - make_interval(days => :days)"
+
+
+def to_cents(value) -> int | None:
+    # same rounding as the PriceHistory price setters
+    return int(round(value * 100)) if value is not None else None
+
+
+def product_content_hash(name, link, img_full_src, img_thumbnail_src) -> str:
+    """
+    Hash of the product metadata ingest keeps up to date.
+    Same value as md5(concat_ws(chr(31), coalesce(name, ''), ...)) in postgres (migration 0009 backfill)
+    """
+    content = "\x1f".join(value or "" for value in (name, link, img_full_src, img_thumbnail_src))
+    return hashlib.md5(content.encode("utf-8")).hexdigest()
+
+
+def copy_value(value) -> str:
+    """COPY text format field"""
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def staging_rows(products: list):
+    for position, product in enumerate(products):
+        product["name_normalized"] = normalize_name(product["name"])  # normalize name for fast index searching in db
+        discount_percentage = product.get("discount_percentage")
+        yield (
+            position,
+            product["name"],
+            product["name_normalized"],
+            product.get("link"),
+            product.get("img_full_src"),
+            product.get("img_thumbnail_src"),
+            to_cents(product.get("regular_price")),
+            to_cents(product.get("discounted_price")),
+            to_cents(product.get("price_per_kg")),
+            to_cents(product.get("discounted_price_per_kg")),
+            round(discount_percentage, 2) if discount_percentage is not None else None,
+            product.get("sale_tag"),  # .get() cause it can be None
+            product_content_hash(
+                product["name"], product.get("link"), product.get("img_full_src"), product.get("img_thumbnail_src")
+            ),
+        )
+
+
+def copy_to_staging(db, products: list):
+    """Streams the scraped products into ingest_staging with COPY, one round trip for the whole batch"""
+    buffer = io.StringIO()
+    for row in staging_rows(products):
+        buffer.write("\t".join(copy_value(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+
+    # raw psycopg2 cursor on the session's connection, so COPY is part of the ingest transaction
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY ingest_staging ({', '.join(STAGING_COLUMNS)}) FROM STDIN", buffer)
+    finally:
+        cursor.close()
+
+
+def resolve_staged_products(db, shop: Shop) -> int:
+    """
+    Fills ingest_staging.product_id, inserting the products seen for the first time.
+    Returns:
+        int: number of new products
+    """
+    params = {"shop_id": shop.id}
+    db.execute(text(RESOLVE_BY_LINK_SQL), params)
+    db.execute(text(RESOLVE_BY_NAME_SQL), params)
+    db.execute(text(RESOLVE_LINKED_BY_NAME_SQL), params)
+    new_products = db.execute(text(INSERT_NEW_PRODUCTS_BY_LINK_SQL), params).scalar_one()
+    new_products += db.execute(text(INSERT_NEW_PRODUCTS_BY_NAME_SQL), params).scalar_one()
+    # only rows that lost an insert race to another transaction are still unresolved here
+    db.execute(text(RESOLVE_BY_LINK_SQL), params)
+    db.execute(text(RESOLVE_BY_NAME_SQL), params)
+    return new_products
+
+
+def record_staged_prices(db) -> tuple[int, int]:
+    """
+    Inserts changed prices, extends the current interval of unchanged ones.
+    Returns:
+        tuple(int, int): (new_prices_counter, same_prices_counter)
+    """
+    db.execute(text(STAGE_PRICES_SQL))
+    new_prices = db.execute(text(INSERT_CHANGED_PRICES_SQL)).rowcount
+    same_prices = db.execute(text(EXTEND_UNCHANGED_PRICES_SQL)).scalar_one()
+    db.execute(text(UPSERT_LATEST_PRICES_SQL))
+    return new_prices, same_prices
+
+
+def add_new_offers(db, products: list, shop: Shop) -> tuple[int, int, int, int, int]:
     """
     Adds freshly scraped products (if they dont already exist) and adds latest offers to Database
-    Only adds new price history entries if prices have changed from the previous entry.
+    Only adds new price history entries if prices have changed from the previous entry,
+    unchanged prices just move last_seen_at of the current entry forward.
+    Known products are only rewritten when their name, link or images changed (content_hash).
+    Price drops of watched products are queued as price_alerts in the same transaction.
 
     Args:
         db (_type_): database session
         products (list): the scraped products list
         shop (Shop): Shop object
     Returns:
-        tuple(int, int, int, int): (new_products_counter, updated_products_counter, new_prices_counter, same_prices_counter)
+        tuple(int, int, int, int, int): (new_products_counter, updated_products_counter, new_prices_counter,
+            same_prices_counter, price_alerts_counter)
     """
-    new_products_counter = 0
-    updated_prices_counter = 0
-    updated_products_counter = 0
-    same_prices_counter = 0
-
-    # Get existing products for this shop
-    shop_products = db.query(Product).filter_by(shop_id=shop.id).all()
-    existing_products_by_link = {p.link: p for p in shop_products}
-    existing_products_by_name = {p.name: p for p in shop_products}
-
-    # Batch insert all price history entries and update products
-    price_history_entries = []
-    for product in products:
-        # Try link first (only if link exists and is not None)
-        if product.get("link") is not None:
-            product_db = existing_products_by_link.get(product["link"])
-
-        # Fall back to name if no link match found
-        if not product_db:
-            product_db = existing_products_by_name.get(product["name"])
-        product["name_normalized"] = normalize_name(product["name"])  # normalize name for fast index searching in db
-
-        if not product_db:
-            # New product - create it
-            product_db = Product(
-                name=product["name"],
-                name_normalized=product["name_normalized"],
-                link=product["link"],
-                img_full_src=product["img_full_src"],
-                img_thumbnail_src=product["img_thumbnail_src"],
-                shop_id=shop.id,
-            )
-            db.add(product_db)  # Add the product to the db
-            db.flush()  # Ensure product ID is generated
-            new_products_counter += 1
-
-        price_history = PriceHistory(
-            product_id=product_db.id,
-            sale_tag=product.get("sale_tag"),  # .get() cause it can be None
-            regular_price=product["regular_price"],
-            discounted_price=product["discounted_price"],
-            price_per_kg=product["price_per_kg"],
-            discounted_price_per_kg=product["discounted_price_per_kg"],
-            discount_percentage=product["discount_percentage"],
-        )
-        price_history_entries.append(price_history)
-
-    # Add all price history entries in bulk
-    if price_history_entries:
-        db.add_all(price_history_entries)
-        updated_prices_counter = len(price_history_entries)
-
-    return (new_products_counter, updated_products_counter, updated_prices_counter, same_prices_counter)
+    if not products:
+        return (0, 0, 0, 0, 0)
+
+    db.execute(text(CREATE_STAGING_SQL))
+    copy_to_staging(db, products)
+    new_products_counter = resolve_staged_products(db, shop)
+    updated_products_counter = db.execute(text(UPDATE_CHANGED_PRODUCTS_SQL)).rowcount
+    updated_prices_counter, same_prices_counter = record_staged_prices(db)
+    price_alerts_counter = db.execute(text(ENQUEUE_PRICE_ALERTS_SQL)).rowcount
+
+    return (
+        new_products_counter,
+        updated_products_counter,
+        updated_prices_counter,
+        same_prices_counter,
+        price_alerts_counter,
+    )
+
+
+def bump_shop_data_version(db, shop: Shop):
+    """Marks the shop's data as changed, commits together with the ingest so readers never see a stale version"""
+    db.execute(
+        update(Shop)
+        .where(Shop.id == shop.id)
+        .values(data_version=Shop.data_version + 1, data_updated_at=func.now())
+    )
+
+
+def prune_price_alerts(days: int = PRICE_ALERT_RETENTION_DAYS) -> int:
+    """
+    Returns:
+        int: number of deleted alerts, the ones older than `days`
+    """
+    db = SessionLocal()
+    try:
+        deleted = db.execute(text(PRUNE_PRICE_ALERTS_SQL), {"days": days}).rowcount
+        db.commit()
+        return deleted
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
 
 
 def upload_scraped_products(products: list, shop_name: str, logger):
@@ -167,12 +509,17 @@ def upload_scraped_products(products: list, shop_name: str, logger):
     try:
         shop = add_or_get_shop(db, shop_name)
         logger.info("Starting upload process...")
-        new_products_counter, updated_products_counter, updated_prices_counter, ignored_prices_counter = add_new_offers(
-            db, products, shop
-        )
+        (
+            new_products_counter,
+            updated_products_counter,
+            updated_prices_counter,
+            ignored_prices_counter,
+            price_alerts_counter,
+        ) = add_new_offers(db, products, shop)
+        bump_shop_data_version(db, shop)
         db.commit()
         logger.info(
-            f"Updated products: {updated_products_counter}  New products added: {new_products_counter}  Updated prices: {updated_prices_counter} Ignored prices: {ignored_prices_counter}"
+            f"Updated products: {updated_products_counter}  New products added: {new_products_counter}  Updated prices: {updated_prices_counter} Ignored prices: {ignored_prices_counter} Price alerts: {price_alerts_counter}"
         )
 
     except IntegrityError as e:
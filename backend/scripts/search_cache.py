@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy.sql import text
+
+# Search results only change when a scraper run commits, so repeated searches ("γαλα", "φετα", ...)
+# are served from memory. Every entry remembers the data_version of the shops it covers;
+# an ingest bumps shops.data_version so only that shop's entries turn stale.
+
+SHOP_VERSIONS_SQL = "SELECT id, data_version FROM shops"
+
+
+class SearchCache:
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 600, versions_poll_seconds: float = 10):
+        """
+        Args:
+            max_entries (int): LRU bound, least recently used entries are evicted first
+            ttl_seconds (float): hard expiry per entry, even if no ingest happened
+            versions_poll_seconds (float): how often shops.data_version is re-read from the db
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.versions_poll_seconds = versions_poll_seconds
+
+        self._entries: OrderedDict = OrderedDict()  # key -> (expires_at, shop_versions, value)
+        self._shop_versions: dict[int, int] = {}
+        self._versions_checked_at = 0.0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(normalized_input: str, shop_ids, limit: int, offset: int, *extra) -> tuple:
+        """Same search = same words (any spacing), same shops (any order), same page"""
+        return (" ".join(normalized_input.split()), tuple(sorted(set(shop_ids or []))), limit, offset, *extra)
+
+    def _versions_for(self, shop_ids) -> tuple:
+        return tuple((shop_id, self._shop_versions.get(shop_id, 0)) for shop_id in shop_ids)
+
+    def get(self, key):
+        """
+        Returns:
+            the cached value, or None on a miss (expired or one of its shops has new data)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, shop_versions, value = entry
+            if expires_at < time.monotonic() or shop_versions != self._versions_for(key[1]):
+                del self._entries[key]
+                self.invalidations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, self._versions_for(key[1]), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def set_shop_versions(self, versions: dict[int, int]):
+        with self._lock:
+            self._shop_versions = dict(versions)
+            self._versions_checked_at = time.monotonic()
+
+    def shop_versions(self) -> dict[int, int]:
+        with self._lock:
+            return dict(self._shop_versions)
+
+    def versions_stale(self) -> bool:
+        return time.monotonic() - self._versions_checked_at >= self.versions_poll_seconds
+
+    async def refresh_shop_versions_async(self, db):
+        """Re-reads shops.data_version (one tiny query) at most every versions_poll_seconds"""
+        if not self.versions_stale():
+            return
+        rows = (await db.execute(text(SHOP_VERSIONS_SQL))).fetchall()
+        self.set_shop_versions({row.id: row.data_version for row in rows})
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "shop_versions": dict(self._shop_versions),
+            }
+
+
+search_cache = SearchCache(
+    max_entries=int(os.environ.get("SEARCH_CACHE_SIZE", "2048")),
+    ttl_seconds=float(os.environ.get("SEARCH_CACHE_TTL", "600")),
+    versions_poll_seconds=float(os.environ.get("SEARCH_CACHE_VERSION_POLL", "10")),
+)
@@ -0,0 +1,188 @@
+import asyncio
+import os
+from array import array
+from bisect import bisect_left
+
+from sqlalchemy.sql import text
+
+from scripts.logging_config import get_logger
+
+logger = get_logger("search_index.py")
+
+# In-process inverted index over products.name_normalized, used when SEARCH_BACKEND=memory.
+# Text matching and shop filtering happen in memory, postgres only fetches the display columns of one page.
+#
+# Matching is per word prefix: "gal lakt" finds names with a word starting with "gal" and one starting
+# with "lakt". (The postgres substring mode also matches inside words.)
+# Results are ordered newest product first (highest id).
+# New products are appended on refresh; when ingest renamed a loaded product (products.updated_at)
+# the index is rebuilt in the background, postings don't know which tokens a product had before.
+
+SEARCH_BACKEND = os.environ.get("SEARCH_BACKEND", "postgres")
+
+PRODUCT_TOKENS_SQL = """
+    SELECT id, shop_id, name_normalized
+    FROM products
+    WHERE id > :after_id
+    ORDER BY id
+"""
+
+# fresh inserts have updated_at = created_at, only metadata updates of loaded products count
+RENAMED_PRODUCTS_SQL = """
+    SELECT EXISTS (
+        SELECT 1
+        FROM products
+        WHERE updated_at > :since
+          AND updated_at > created_at
+          AND id <= :max_id
+    )
+"""
+
+
+def tokenize(name_normalized: str | None) -> set[str]:
+    return set(name_normalized.split()) if name_normalized else set()
+
+
+class InvertedIndex:
+    # what a rebuild replaces, swapped in one go so searches never see a half built index
+    STATE = ("postings", "vocabulary", "_new_tokens", "shop_by_product", "max_product_id", "product_count")
+
+    def __init__(self):
+        self.postings: dict[str, array] = {}  # token -> ascending product ids ('i' = int32)
+        self.vocabulary: list[str] = []  # sorted tokens, for prefix lookups with bisect
+        self._new_tokens: list[str] = []  # merged into vocabulary once per refresh, not per insert
+        self.shop_by_product = array("h")  # shop_by_product[product_id] = shop_id, 0 = no product
+        self.max_product_id = 0
+        self.product_count = 0
+        self.loaded_versions: dict[int, int] | None = None  # shops.data_version the index reflects
+        self.loaded_at = None  # database time (products.updated_at clock) of the last refresh
+        self._refresh_lock = asyncio.Lock()
+        self._rebuild_task: asyncio.Task | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at is not None
+
+    def add(self, product_id: int, shop_id: int, name_normalized: str | None):
+        """Ids must arrive in ascending order, so postings stay sorted by plain appends"""
+        if product_id <= self.max_product_id:
+            return
+        for token in tokenize(name_normalized):
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = array("i")
+                self._new_tokens.append(token)
+            posting.append(product_id)
+
+        if len(self.shop_by_product) <= product_id:
+            self.shop_by_product.extend(array("h", bytes(2 * (product_id + 1 - len(self.shop_by_product)))))
+        self.shop_by_product[product_id] = shop_id
+        self.max_product_id = product_id
+        self.product_count += 1
+
+    def prefix_matches(self, term: str) -> set[int]:
+        """Ids of every product with a word starting with term"""
+        matches = set()
+        i = bisect_left(self.vocabulary, term)
+        while i < len(self.vocabulary) and self.vocabulary[i].startswith(term):
+            matches.update(self.postings[self.vocabulary[i]])
+            i += 1
+        return matches
+
+    def search(self, terms: list[str], shop_ids: list[int] | None, limit: int, offset: int = 0, after_id=None):
+        """
+        Args:
+            after_id (int): keyset cursor, only ids below it are returned (offset is ignored)
+        Returns:
+            tuple(list[int], bool): (product ids of the page newest first, has_more)
+        """
+        if not terms or not shop_ids:
+            return [], False
+
+        # intersect the rarest term first, the rest only filter
+        candidates = sorted((self.prefix_matches(term) for term in set(terms)), key=len)
+        matched = candidates[0].intersection(*candidates[1:])
+
+        shops = set(shop_ids)
+        shop_by_product = self.shop_by_product
+        if after_id is not None:
+            matched = (pid for pid in matched if pid < after_id)
+            offset = 0
+        ids = sorted((pid for pid in matched if shop_by_product[pid] in shops), reverse=True)
+        page = ids[offset : offset + limit + 1]
+        return page[:limit], len(page) > limit
+
+    async def load_async(self, db) -> int:
+        """Appends the products inserted after max_product_id, returns how many"""
+        before = self.product_count
+        result = await db.stream(text(PRODUCT_TOKENS_SQL), {"after_id": self.max_product_id})
+        async for row in result:
+            self.add(row.id, row.shop_id, row.name_normalized)
+        if self._new_tokens:
+            self.vocabulary = sorted(self.vocabulary + self._new_tokens)
+            self._new_tokens = []
+        return self.product_count - before
+
+    async def refresh_async(self, db, shop_versions: dict[int, int], session_factory=None):
+        """
+        Loads products inserted since the last refresh (all of them on the first call).
+        Renamed products need a full rebuild, that one runs in the background on a session of session_factory.
+        """
+        async with self._refresh_lock:
+            if self.loaded_versions == shop_versions:
+                return  # another request refreshed while we waited
+            # transaction start as a plain timestamp like products.updated_at (asyncpg refuses an aware
+            # datetime for it), updates committed while loading are seen next time
+            loaded_at = await db.scalar(text("SELECT localtimestamp"))
+            renamed = self.loaded_at is not None and await db.scalar(
+                text(RENAMED_PRODUCTS_SQL), {"since": self.loaded_at, "max_id": self.max_product_id}
+            )
+            added = await self.load_async(db)
+            self.loaded_versions = dict(shop_versions)
+            if renamed and session_factory is not None:
+                # loaded_at stays put until the rebuild lands, so a failed one is detected again
+                self.start_rebuild(session_factory)
+            else:
+                self.loaded_at = loaded_at
+            logger.info(
+                f"Search index refreshed: +{added} products, "
+                f"{self.product_count} products / {len(self.vocabulary)} tokens total"
+            )
+
+    def start_rebuild(self, session_factory):
+        if self._rebuild_task is not None and not self._rebuild_task.done():
+            return
+        logger.info("Products were renamed since the last refresh, rebuilding the search index in the background")
+        self._rebuild_task = asyncio.create_task(self.rebuild_async(session_factory))
+
+    async def rebuild_async(self, session_factory):
+        """Builds a new index aside (searches keep using the current one) and swaps it in"""
+        try:
+            index = InvertedIndex()
+            async with session_factory() as db:
+                loaded_at = await db.scalar(text("SELECT localtimestamp"))
+                await index.load_async(db)
+                async with self._refresh_lock:
+                    await index.load_async(db)  # products the incremental refreshes added meanwhile
+                    for attribute in self.STATE:
+                        setattr(self, attribute, getattr(index, attribute))
+                    self.loaded_at = loaded_at
+            logger.info(f"Search index rebuilt: {self.product_count} products / {len(self.vocabulary)} tokens")
+        except Exception as e:
+            # the next search refreshes again and retries, meanwhile the current index keeps answering
+            logger.exception(f"Rebuilding the search index failed: {e}")
+            self.loaded_versions = None
+
+    def stats(self) -> dict:
+        return {
+            "backend": SEARCH_BACKEND,
+            "ready": self.ready,
+            "products": self.product_count,
+            "tokens": len(self.vocabulary),
+            "postings": sum(len(posting) for posting in self.postings.values()),
+            "max_product_id": self.max_product_id,
+            "loaded_versions": self.loaded_versions,
+        }
+
+
+search_index = InvertedIndex()
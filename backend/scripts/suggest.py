@@ -0,0 +1,110 @@
+import asyncio
+import heapq
+from bisect import bisect_left
+from collections import Counter
+
+from sqlalchemy.sql import text
+
+from scripts.logging_config import get_logger
+
+logger = get_logger("suggest.py")
+
+# Autocomplete for the search bar (/products/suggest), answered from sorted arrays with bisect.
+# Built from products.name_normalized only, rebuilt in the background when an ingest bumps shops.data_version.
+
+PRODUCT_NAMES_SQL = "SELECT name_normalized FROM products WHERE name_normalized IS NOT NULL"
+
+# top terms are precomputed for prefixes up to this length, longer prefixes only cover a few terms
+PRECOMPUTED_PREFIX_LENGTH = 3
+PRECOMPUTED_TOP_TERMS = 20
+
+
+class PrefixSuggester:
+    def __init__(self, names: list[str]):
+        term_counts = Counter(term for name in names for term in set(name.split()))
+
+        self.names = sorted(set(names))
+        self.terms = sorted(term_counts)
+        self.term_counts = [term_counts[term] for term in self.terms]
+
+        # prefix -> most popular terms starting with it, best first
+        by_prefix: dict[str, list] = {}
+        for term, count in term_counts.items():
+            for length in range(1, min(len(term), PRECOMPUTED_PREFIX_LENGTH) + 1):
+                by_prefix.setdefault(term[:length], []).append((count, term))
+        self.top_terms = {
+            prefix: [term for _, term in heapq.nlargest(PRECOMPUTED_TOP_TERMS, candidates)]
+            for prefix, candidates in by_prefix.items()
+        }
+
+    @staticmethod
+    def prefix_range(sorted_values: list[str], prefix: str) -> tuple[int, int]:
+        return bisect_left(sorted_values, prefix), bisect_left(sorted_values, prefix + "\uffff")
+
+    def complete_term(self, prefix: str, limit: int) -> list[str]:
+        if len(prefix) <= PRECOMPUTED_PREFIX_LENGTH:
+            return self.top_terms.get(prefix, [])[:limit]
+        start, end = self.prefix_range(self.terms, prefix)
+        best = heapq.nlargest(limit, range(start, end), key=self.term_counts.__getitem__)
+        return [self.terms[i] for i in best]
+
+    def suggest(self, prefix: str, limit: int = 8) -> list[str]:
+        """
+        Args:
+            prefix (str): normalized input, the last word is completed unless it ends with a space
+        Returns:
+            list[str]: popular word completions first, then product names starting with the prefix
+        """
+        words = prefix.split()
+        if not words:
+            return []
+
+        suggestions = []
+        if not prefix.endswith(" "):
+            head = " ".join(words[:-1])
+            for term in self.complete_term(words[-1], limit):
+                suggestions.append(f"{head} {term}" if head else term)
+
+        name_prefix = " ".join(words) + (" " if prefix.endswith(" ") else "")
+        start, end = self.prefix_range(self.names, name_prefix)
+        for name in self.names[start : min(end, start + limit)]:
+            if name not in suggestions:
+                suggestions.append(name)
+        return suggestions[:limit]
+
+
+class SuggestService:
+    """Holds the current PrefixSuggester and swaps in a rebuilt one after ingests"""
+
+    def __init__(self):
+        self.suggester: PrefixSuggester | None = None
+        self.loaded_versions: dict[int, int] | None = None
+        self._rebuild_task: asyncio.Task | None = None
+
+    async def rebuild_async(self, session_factory, shop_versions: dict[int, int]):
+        try:
+            async with session_factory() as db:
+                names = (await db.execute(text(PRODUCT_NAMES_SQL))).scalars().all()
+            # sorting + counting a few hundred thousand names is cpu work, keep it off the event loop
+            self.suggester = await asyncio.to_thread(PrefixSuggester, names)
+            self.loaded_versions = dict(shop_versions)
+            logger.info(f"Suggestions rebuilt: {len(self.suggester.names)} names, {len(self.suggester.terms)} terms")
+        except Exception as e:
+            # next request retries, meanwhile the previous suggester keeps answering
+            logger.exception(f"Rebuilding suggestions failed: {e}")
+
+    def ensure_fresh(self, session_factory, shop_versions: dict[int, int]):
+        """Starts a background rebuild if the data changed, requests keep using the old one meanwhile"""
+        if self.loaded_versions == shop_versions:
+            return
+        if self._rebuild_task is not None and not self._rebuild_task.done():
+            return
+        self._rebuild_task = asyncio.create_task(self.rebuild_async(session_factory, shop_versions))
+
+    def suggest(self, prefix: str, limit: int) -> list[str]:
+        if self.suggester is None:
+            return []  # first build still running
+        return self.suggester.suggest(prefix, limit)
+
+
+suggest_service = SuggestService()
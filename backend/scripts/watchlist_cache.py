@@ -0,0 +1,177 @@
+import os
+import threading
+from collections import OrderedDict
+
+import orjson
+
+from scripts.logging_config import get_logger
+
+logger = get_logger("watchlist_cache.py")
+
+# The search page asks for /users/{id}/watchlists/summary on every load, the summary changes only when the
+# user edits a watchlist. Entries are stored with users.watchlists_version (the summary endpoint reads it for
+# its ETag anyway) and served only for that exact version, so a worker that missed a write never serves it.
+# The watchlist endpoints write through after commit: the cached summary is patched to the new version,
+# or dropped when it wasn't at the version right before the change.
+#
+# WATCHLIST_CACHE_BACKEND=memory (default, per worker) or redis (shared by all workers, REDIS_URL,
+# needs `pip install redis`)
+
+
+class LocalSummaryStore:
+    """In-process LRU, user_id -> (watchlists_version, summary)"""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def get(self, user_id: int):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+            return entry
+
+    async def set(self, user_id: int, version: int, watchlists: list):
+        with self._lock:
+            self._entries[user_id] = (version, watchlists)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def delete(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class RedisSummaryStore:
+    """Same interface on a shared redis, entries expire after ttl_seconds"""
+
+    def __init__(self, url: str, ttl_seconds: int = 86400):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("WATCHLIST_CACHE_BACKEND=redis needs the redis package (pip install redis)") from e
+        self.client = redis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def key(user_id: int) -> str:
+        return f"watchlist-summary:{user_id}"
+
+    async def get(self, user_id: int):
+        raw = await self.client.get(self.key(user_id))
+        if raw is None:
+            return None
+        entry = orjson.loads(raw)
+        return entry["version"], entry["watchlists"]
+
+    async def set(self, user_id: int, version: int, watchlists: list):
+        payload = orjson.dumps({"version": version, "watchlists": watchlists})
+        await self.client.set(self.key(user_id), payload, ex=self.ttl_seconds)
+
+    async def delete(self, user_id: int):
+        await self.client.delete(self.key(user_id))
+
+    def size(self) -> int | None:
+        return None  # shared, not counted per worker
+
+
+class WatchlistSummaryCache:
+    def __init__(self, store):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self.write_throughs = 0
+        self.invalidations = 0
+
+    async def get(self, user_id: int, version: int) -> list | None:
+        entry = await self.store.get(user_id)
+        if entry is None or entry[0] != version:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    async def put(self, user_id: int, version: int, watchlists: list):
+        await self.store.set(user_id, version, watchlists)
+
+    async def apply(self, user_id: int, new_version: int, change):
+        """
+        Write-through after a committed watchlist change.
+        Args:
+            new_version (int): users.watchlists_version after the change
+            change (callable): patches the summary list in place
+        """
+        entry = await self.store.get(user_id)
+        if entry is None:
+            return
+        version, watchlists = entry
+        if version != new_version - 1:
+            # another change landed in between, rebuild from the database on the next read
+            await self.store.delete(user_id)
+            self.invalidations += 1
+            return
+        change(watchlists)
+        await self.store.set(user_id, new_version, watchlists)
+        self.write_throughs += 1
+
+    async def add_watchlist(self, user_id: int, new_version: int, watchlist_id: int, name: str):
+        def change(watchlists):
+            # a summary read right after the commit may already hold it
+            if all(watchlist["id"] != watchlist_id for watchlist in watchlists):
+                watchlists.append({"id": watchlist_id, "name": name, "product_ids": []})
+
+        await self.apply(user_id, new_version, change)
+
+    async def remove_watchlist(self, user_id: int, new_version: int, watchlist_id: int):
+        def change(watchlists):
+            watchlists[:] = [watchlist for watchlist in watchlists if watchlist["id"] != watchlist_id]
+
+        await self.apply(user_id, new_version, change)
+
+    async def change_products(self, user_id: int, new_version: int, watchlist_id: int, added=(), removed=()):
+        """
+        Products added to / removed from one watchlist by a single committed change.
+        Applied in the order of the statements (insert, then delete), so an id in both ends up absent like in the db.
+        """
+
+        def change(watchlists):
+            removed_ids = set(removed)
+            for watchlist in watchlists:
+                if watchlist["id"] == watchlist_id:
+                    product_ids = list(watchlist["product_ids"])
+                    present = set(product_ids)
+                    product_ids.extend(pid for pid in added if pid not in present)
+                    watchlist["product_ids"] = [pid for pid in product_ids if pid not in removed_ids]
+
+        await self.apply(user_id, new_version, change)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.store).__name__,
+            "entries": self.store.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "write_throughs": self.write_throughs,
+            "invalidations": self.invalidations,
+        }
+
+
+def make_store():
+    backend = os.environ.get("WATCHLIST_CACHE_BACKEND", "memory").strip().lower()
+    if backend == "redis":
+        url = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+        logger.info(f"Watchlist summary cache on redis ({url})")
+        return RedisSummaryStore(url)
+    return LocalSummaryStore(int(os.environ.get("WATCHLIST_CACHE_SIZE", "10000")))
+
+
+watchlist_cache = WatchlistSummaryCache(make_store())
@@ -0,0 +1,10 @@
+import sys
+from pathlib import Path
+
+# Run from the repository root or from backend/: the modules import each other as data.* / scripts.*
+# like the api and the scrapers, which start in backend/.
+# Usage: python -m pytest backend/tests -q
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
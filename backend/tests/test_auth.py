@@ -0,0 +1,67 @@
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from scripts import auth
+
+
+@pytest.fixture
+def secret(monkeypatch):
+    monkeypatch.setattr(auth, "SECRET", b"test secret")
+    monkeypatch.setattr(auth, "TOKENS_ENABLED", True)
+    monkeypatch.setattr(auth, "deny_list", auth.DenyList())
+
+
+def claims(jti="a", sub=1, iat=None):
+    now = time.time() if iat is None else iat
+    return {"sub": sub, "jti": jti, "iat": now, "exp": now + auth.TOKEN_TTL_SECONDS}
+
+
+def test_deny_list_token():
+    deny_list = auth.DenyList()
+    deny_list.revoke_token(claims("a"))
+    assert deny_list.is_denied(claims("a"))
+    assert not deny_list.is_denied(claims("b"))
+
+
+def test_deny_list_user_covers_earlier_tokens_only():
+    deny_list = auth.DenyList()
+    earlier = claims("a", iat=time.time() - 10)
+    deny_list.revoke_user(1)
+    assert deny_list.is_denied(earlier)
+    assert not deny_list.is_denied(claims("b", sub=2, iat=time.time() - 10))
+    assert not deny_list.is_denied(claims("c", iat=time.time() + 10))
+
+
+def test_deny_list_forgets_expired_entries():
+    deny_list = auth.DenyList()
+    expired = claims("old", iat=time.time() - 2 * auth.TOKEN_TTL_SECONDS)
+    deny_list.revoke_token(expired)
+    deny_list.revoke_token(claims("new"))  # every revoke prunes first
+    deny_list.revoke_token(claims("newer"))
+    assert deny_list.stats() == {"tokens": 2, "users": 0}
+
+
+def test_token_round_trip(secret):
+    decoded = auth.decode_token(auth.issue_token(7, "a@b.gr"))
+    assert decoded["sub"] == 7
+    assert decoded["email"] == "a@b.gr"
+
+
+@pytest.mark.parametrize(
+    "tamper",
+    [lambda t: t + "x", lambda t: "x" + t, lambda t: t.replace(".", ""), lambda t: t + "é"],  # é: non-ascii header
+)
+def test_tampered_token_is_a_401(secret, tamper):
+    with pytest.raises(HTTPException) as error:
+        auth.decode_token(tamper(auth.issue_token(7, "a@b.gr")))
+    assert error.value.status_code == 401
+
+
+def test_revoked_token_is_a_401(secret):
+    token = auth.issue_token(7, "a@b.gr")
+    auth.deny_list.revoke_token(auth.decode_token(token))
+    with pytest.raises(HTTPException) as error:
+        auth.decode_token(token)
+    assert error.value.detail == "Token revoked"
@@ -0,0 +1,42 @@
+import hashlib
+import re
+from pathlib import Path
+
+from scripts.scrapers.scraper_helpers import product_content_hash
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "migrations"
+COLUMNS = ("name", "link", "img_full_src", "img_thumbnail_src")
+
+
+def sql_backfill_hash(*values) -> str:
+    """md5(concat_ws(chr(31), coalesce(column, ''), ...)) of migration 0009, no argument of concat_ws is null"""
+    return hashlib.md5(chr(31).join("" if value is None else value for value in values).encode("utf-8")).hexdigest()
+
+
+def test_migration_hashes_the_same_columns_in_the_same_order():
+    sql = (MIGRATIONS_DIR / "0009_product_content_hash.sql").read_text(encoding="utf-8")
+    expression = re.search(r"md5\(concat_ws\((.*?)\)\)", sql, re.DOTALL).group(1)
+    assert re.findall(r"coalesce\((\w+), ''\)", expression) == list(COLUMNS)
+    assert expression.strip().startswith("chr(31)")
+
+
+def test_matches_the_backfill():
+    rows = [
+        ("Γάλα 1lt", "https://shop.gr/gala", None, None),
+        ("Γάλα 1lt", "https://shop.gr/gala", "https://shop.gr/full.jpg", "https://shop.gr/thumb.jpg"),
+        (None, None, None, None),
+        ("a\tb\nc", "", "", None),
+    ]
+    for row in rows:
+        assert product_content_hash(*row) == sql_backfill_hash(*row)
+
+
+def test_known_values():
+    # what postgres returns for these rows
+    gala = product_content_hash("Γάλα 1lt", "https://shop.gr/gala", None, None)
+    assert gala == "e7517361736f3ea9d517e4b47200c574"
+    assert product_content_hash(None, None, None, None) == "0abf35f7883e45d77c8a2c0a1e8ef8c6"
+
+
+def test_separator_keeps_fields_apart():
+    assert product_content_hash("ab", "c", None, None) != product_content_hash("a", "bc", None, None)
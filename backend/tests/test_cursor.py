@@ -0,0 +1,55 @@
+import base64
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+
+from scripts.helper import decode_cursor, encode_cursor
+
+
+@pytest.mark.parametrize(
+    "sort_key, parse_sort_key",
+    [
+        (1250, int),
+        (Decimal("12.50"), Decimal),
+        (datetime(2026, 3, 1, 12, 30, 5), datetime.fromisoformat),
+        (None, int),
+    ],
+)
+def test_round_trip(sort_key, parse_sort_key):
+    cursor = encode_cursor(sort_key, 42)
+    assert "=" not in cursor
+    assert decode_cursor(cursor, parse_sort_key) == (sort_key, 42)
+
+
+def test_parse_sort_key_not_called_for_null_key():
+    def parse(_):
+        raise AssertionError("called")
+
+    assert decode_cursor(encode_cursor(None, 7), parse) == (None, 7)
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not a cursor",
+        "",
+        base64.urlsafe_b64encode(b"[1]").decode("ascii"),  # one value instead of (sort key, id)
+        base64.urlsafe_b64encode(b'{"a": 1}').decode("ascii"),
+        base64.urlsafe_b64encode(b'[1, "x"]').decode("ascii"),  # id is not a number
+        base64.urlsafe_b64encode(b'["abc", 3]').decode("ascii"),  # sort key doesn't parse
+        "é",
+    ],
+)
+def test_tampered_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, Decimal)
+    assert error.value.status_code == 400
+
+
+def test_tampered_sort_key_of_the_wrong_type():
+    cursor = encode_cursor("2026-03-01 12:30:05", 3)
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, int)
+    assert error.value.status_code == 400
@@ -0,0 +1,42 @@
+import pytest
+from starlette.requests import Request
+
+from scripts.http_cache import etag_matches, make_etag, shop_data_etag
+
+
+def request_with(if_none_match: str | None) -> Request:
+    headers = [] if if_none_match is None else [(b"if-none-match", if_none_match.encode("latin-1"))]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+ETAG = make_etag("shops", 1)
+
+
+@pytest.mark.parametrize(
+    "if_none_match, matches",
+    [
+        (None, False),
+        ("", False),
+        (ETAG, True),
+        (ETAG.removeprefix("W/"), True),  # weak comparison
+        ("*", True),
+        (f'"other", {ETAG}', True),
+        (f'W/"other",{ETAG.removeprefix("W/")}', True),
+        ('W/"other"', False),
+    ],
+)
+def test_etag_matches(if_none_match, matches):
+    assert etag_matches(request_with(if_none_match), ETAG) is matches
+
+
+def test_make_etag_is_weak_and_stable():
+    assert ETAG.startswith('W/"') and ETAG.endswith('"')
+    assert make_etag("shops", 1) == ETAG
+    assert make_etag("shops", 2) != ETAG
+
+
+def test_shop_data_etag_changes_only_with_the_covered_shops():
+    etag = shop_data_etag({1: 1, 2: 1}, [2, 1], "gala")
+    assert shop_data_etag({1: 1, 2: 1, 3: 5}, [1, 2], "gala") == etag
+    assert shop_data_etag({1: 1, 2: 2}, [1, 2], "gala") != etag
+    assert shop_data_etag({1: 1, 2: 1}, None) == shop_data_etag({1: 1, 2: 1}, [1, 2])
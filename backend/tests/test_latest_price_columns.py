@@ -0,0 +1,37 @@
+from collections import namedtuple
+from datetime import datetime
+
+from scripts.helper import (
+    PRODUCTS_BY_IDS_WITH_WATCHLISTS_SQL,
+    build_search_query,
+    encode_cursor,
+    product_row_to_dict,
+)
+
+Row = namedtuple(
+    "Row",
+    "id name link img_thumbnail_src img_full_src shop_id shop_name regular_price discounted_price price_per_kg "
+    "discounted_price_per_kg sale_tag discount_percentage price_created_at price_last_seen_at",
+)
+
+
+def test_last_updated_is_the_last_scrape_not_the_last_price_change():
+    changed, seen = datetime(2026, 1, 3), datetime(2026, 10, 16)
+    row = Row(1, "gala", None, None, None, 1, "ab", 189, None, None, None, None, None, changed, seen)
+    product = product_row_to_dict(row)
+    assert product["price_history"]["created_at"] == changed
+    assert product["last_updated"] == seen
+
+
+def test_substring_search_sorts_and_seeks_on_last_seen_at():
+    cursor = encode_cursor(datetime(2026, 10, 16, 7, 0), 42)
+    sql, params = build_search_query("gala", [1], 20, 0, "substring", cursor)
+    assert "ORDER BY lp.last_seen_at DESC NULLS LAST, p.id DESC" in sql
+    assert "lp.last_seen_at AS sort_key" in sql
+    assert params["cursor_key"] == datetime(2026, 10, 16, 7, 0)
+
+
+def test_index_backend_rows_keep_both_columns_with_watchlists():
+    assert "lp.created_at AS price_created_at" in PRODUCTS_BY_IDS_WITH_WATCHLISTS_SQL
+    assert "lp.last_seen_at AS price_last_seen_at," in PRODUCTS_BY_IDS_WITH_WATCHLISTS_SQL
+    assert "watchlist_ids" in PRODUCTS_BY_IDS_WITH_WATCHLISTS_SQL
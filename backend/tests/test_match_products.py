@@ -0,0 +1,61 @@
+import pytest
+
+from scripts.match_products import (
+    BANDS,
+    ShopExclusiveUnionFind,
+    candidate_pairs,
+    jaccard,
+    lsh_buckets,
+    parse_name,
+)
+
+
+@pytest.mark.parametrize(
+    "name, size, words",
+    [
+        ("gala delta 1lt", "1000ml", {"gala", "delta"}),
+        ("gala delta 1 lt", "1000ml", {"gala", "delta"}),
+        ("nero zagori 1,5l", "1500ml", {"nero", "zagori"}),
+        ("bira alfa 6x330ml", "6x330ml", {"bira", "alfa"}),
+        ("bira alfa 6 x 330 ml", "6x330ml", {"bira", "alfa"}),
+        ("zachari 1kg", "1000g", {"zachari"}),
+        ("avga 10 tem.", "10tem", {"avga"}),
+        ("galaktoboureko a", "", {"galaktoboureko"}),  # one letter words are dropped
+    ],
+)
+def test_parse_name(name, size, words):
+    assert parse_name(name) == (size, frozenset(words))
+
+
+def test_lsh_buckets_are_stable_and_blocked_by_size():
+    size, words = parse_name("gala delta fresko 1lt")
+    keys = lsh_buckets(size, words)
+    assert len(keys) == BANDS
+    assert keys == lsh_buckets(size, words)
+    assert all(-(1 << 63) <= key < (1 << 63) for key in keys)  # fits a bigint
+    assert not set(keys) & set(lsh_buckets("2000ml", words))
+
+
+def test_jaccard():
+    assert jaccard(frozenset("ab"), frozenset("bc")) == 1 / 3
+    assert jaccard(frozenset(), frozenset()) == 0.0
+
+
+def test_union_find_refuses_two_products_of_a_shop():
+    groups = ShopExclusiveUnionFind()
+    for product_id, shop_id in ((1, 1), (2, 2), (3, 1), (4, 3)):
+        groups.add(product_id, shop_id)
+    assert groups.union(2, 4)
+    assert groups.union(4, 3)
+    assert groups.find(4) == 2  # smallest id is the group id
+    assert not groups.union(1, 2)  # shop 1 is already in the group
+    assert not groups.union(3, 4)  # already together
+    assert groups.find(1) == 1
+
+
+def test_candidate_pairs():
+    products = {1: (1, "", frozenset()), 2: (2, "", frozenset()), 3: (1, "", frozenset()), 4: (3, "", frozenset())}
+    buckets = [[1, 2, 3], [3, 4], [1]]
+    # same shop pairs are skipped, and pairs of products that were both matched before
+    assert candidate_pairs(products, buckets, new_ids={3}) == {(2, 3), (3, 4)}
+    assert candidate_pairs(products, buckets, new_ids={1, 2, 3, 4}) == {(1, 2), (2, 3), (3, 4)}
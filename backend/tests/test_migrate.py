@@ -0,0 +1,104 @@
+import pytest
+
+from scripts import migrate
+from scripts.migrate import available_migrations, split_statements, strip_comments
+
+
+def test_splits_on_semicolons_outside_comments_and_strings():
+    sql = """
+        -- a comment; not a statement
+        BEGIN;
+        /* block; comment */
+        UPDATE shops SET name = 'a;b' WHERE name = 'it''s; fine';
+        CREATE FUNCTION f() RETURNS int AS $body$ SELECT 1; $body$ LANGUAGE sql;
+        SELECT ";" FROM x;
+        COMMIT;
+        -- trailing comment
+    """
+    statements = split_statements(sql)
+    assert len(statements) == 5
+    assert statements[0] == "-- a comment; not a statement\n        BEGIN"
+    assert statements[1].endswith("WHERE name = 'it''s; fine'")
+    assert "$body$ SELECT 1; $body$" in statements[2]
+    assert statements[3] == 'SELECT ";" FROM x'
+    assert statements[4] == "COMMIT"
+
+
+def test_statement_without_trailing_semicolon():
+    assert split_statements("SELECT 1;\nSELECT 2") == ["SELECT 1", "SELECT 2"]
+
+
+@pytest.mark.parametrize("version, path", available_migrations())
+def test_concurrently_runs_outside_transaction_blocks(version, path):
+    # the statements are sent one by one on an autocommit connection, only the file's BEGIN opens a block
+    open_block = False
+    for statement in split_statements(path.read_text(encoding="utf-8")):
+        sql = strip_comments(statement).strip().upper()
+        if sql in ("BEGIN", "START TRANSACTION"):
+            open_block = True
+        elif sql == "COMMIT":
+            open_block = False
+        elif "CONCURRENTLY" in sql:
+            assert not open_block, f"{version}: CONCURRENTLY inside BEGIN / COMMIT"
+
+
+class FakeConnection:
+    """schema_migrations and the 'users' table check of a database, the statements themselves are not run"""
+
+    def __init__(self, versions=(), has_tables=True):
+        self.versions = set(versions)
+        self.has_tables = has_tables
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+
+        class Result:
+            def __init__(self, values):
+                self.values = values
+
+            def scalars(self):
+                return self.values
+
+            def scalar_one(self):
+                return self.values[0]
+
+        if sql.startswith("SELECT version"):
+            return Result(list(self.versions))
+        if "to_regclass" in sql:
+            return Result([not self.has_tables])
+        if sql.startswith("INSERT INTO schema_migrations"):
+            self.versions.update(row["version"] for row in params)
+        return Result([])
+
+
+@pytest.fixture
+def ran(monkeypatch):
+    ran = []
+    monkeypatch.setattr(migrate, "run_migration_file", lambda connection, path: ran.append(path.stem))
+    return ran
+
+
+def test_unversioned_database_needs_a_baseline(ran):
+    with pytest.raises(RuntimeError):
+        migrate.upgrade(FakeConnection())
+    assert ran == []
+
+
+def test_adopt_none_runs_every_migration_once(ran):
+    connection = FakeConnection()
+    versions = [version for version, _ in available_migrations()]
+    assert migrate.upgrade(connection, adopt="none") == versions
+    assert ran == versions
+    # the next run is a plain upgrade, the flag is ignored once there is a history
+    assert migrate.upgrade(connection, adopt="none") == []
+    assert ran == versions
+
+
+def test_adopt_a_version_skips_what_the_database_has(ran):
+    versions = [version for version, _ in available_migrations()]
+    assert migrate.upgrade(FakeConnection(), adopt=versions[1].split("_")[0]) == versions[2:]
+
+
+def test_baseline_of_an_unknown_version():
+    with pytest.raises(ValueError):
+        migrate.baseline(FakeConnection(), "0000")
@@ -0,0 +1,48 @@
+from scripts.search_cache import SearchCache
+
+
+def test_make_key_ignores_spacing_and_shop_order():
+    assert SearchCache.make_key(" gala  delta ", [3, 1, 3], 20, 0) == SearchCache.make_key("gala delta", [1, 3], 20, 0)
+    assert SearchCache.make_key("gala", [1], 20, 0) != SearchCache.make_key("gala", [1], 20, 20)
+
+
+def test_hit_until_one_of_its_shops_gets_new_data():
+    cache = SearchCache()
+    cache.set_shop_versions({1: 1, 2: 1, 3: 1})
+    key = SearchCache.make_key("gala", [1, 2], 20, 0)
+    cache.put(key, ["page"])
+    assert cache.get(key) == ["page"]
+
+    cache.set_shop_versions({1: 1, 2: 1, 3: 2})  # a shop the entry doesn't cover
+    assert cache.get(key) == ["page"]
+
+    cache.set_shop_versions({1: 1, 2: 2, 3: 2})
+    assert cache.get(key) is None
+    assert cache.stats()["invalidations"] == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_ttl_expiry():
+    cache = SearchCache(ttl_seconds=-1)
+    key = SearchCache.make_key("gala", [1], 20, 0)
+    cache.put(key, ["page"])
+    assert cache.get(key) is None
+
+
+def test_lru_eviction():
+    cache = SearchCache(max_entries=2)
+    first, second, third = (SearchCache.make_key(word, [1], 20, 0) for word in ("a", "b", "c"))
+    cache.put(first, 1)
+    cache.put(second, 2)
+    cache.get(first)  # second is now the least recently used
+    cache.put(third, 3)
+    assert cache.get(second) is None
+    assert cache.get(first) == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_versions_poll_interval():
+    cache = SearchCache(versions_poll_seconds=60)
+    assert cache.versions_stale()
+    cache.set_shop_versions({1: 1})
+    assert not cache.versions_stale()
@@ -0,0 +1,67 @@
+from scripts.search_index import InvertedIndex, tokenize
+
+PRODUCTS = [
+    (1, 1, "gala delta 1lt"),
+    (2, 2, "gala olympos 1lt"),
+    (3, 1, "galaktoboureko"),
+    (5, 3, "gala delta 2lt"),
+    (8, 2, "nero zagori 1.5lt"),
+]
+
+
+def build_index(products=PRODUCTS) -> InvertedIndex:
+    index = InvertedIndex()
+    for product in products:
+        index.add(*product)
+    index.vocabulary = sorted(index.vocabulary + index._new_tokens)  # what load_async does after a batch
+    index._new_tokens = []
+    return index
+
+
+def test_tokenize():
+    assert tokenize("gala delta gala") == {"gala", "delta"}
+    assert tokenize(None) == set()
+    assert tokenize("") == set()
+
+
+def test_prefix_matches():
+    index = build_index()
+    assert index.prefix_matches("gal") == {1, 2, 3, 5}
+    assert index.prefix_matches("gala") == {1, 2, 3, 5}
+    assert index.prefix_matches("galak") == {3}
+    assert index.prefix_matches("x") == set()
+
+
+def test_search_intersects_terms_newest_first():
+    index = build_index()
+    assert index.search(["gal", "del"], [1, 2, 3], limit=10) == ([5, 1], False)
+    assert index.search(["gala", "1lt"], [1, 2, 3], limit=10) == ([2, 1], False)
+    assert index.search(["gala", "nero"], [1, 2, 3], limit=10) == ([], False)
+
+
+def test_search_filters_shops():
+    index = build_index()
+    assert index.search(["gala"], [2], limit=10) == ([2], False)
+    assert index.search(["gala"], [], limit=10) == ([], False)
+    assert index.search([], [1, 2, 3], limit=10) == ([], False)
+
+
+def test_search_pages():
+    index = build_index()
+    assert index.search(["gal"], [1, 2, 3], limit=2) == ([5, 3], True)
+    assert index.search(["gal"], [1, 2, 3], limit=2, offset=2) == ([2, 1], False)
+    # keyset: after_id wins over offset
+    assert index.search(["gal"], [1, 2, 3], limit=2, offset=2, after_id=3) == ([2, 1], False)
+
+
+def test_add_ignores_ids_already_loaded():
+    index = build_index()
+    index.add(5, 1, "something else")
+    index.add(4, 1, "something else")
+    assert index.product_count == len(PRODUCTS)
+    assert "something" not in index.postings
+    assert index.shop_by_product[5] == 3
+
+
+def test_not_ready_until_loaded():
+    assert not InvertedIndex().ready
@@ -0,0 +1,24 @@
+from scripts.suggest import PrefixSuggester
+
+NAMES = ["gala delta 1lt", "gala olympos 1lt", "galaktoboureko", "gala delta 2lt", "nero zagori 1.5lt"]
+
+
+def test_suggest_completes_the_last_word_by_popularity():
+    suggester = PrefixSuggester(NAMES)
+    assert suggester.suggest("gal", limit=2) == ["gala", "galaktoboureko"]
+    assert suggester.suggest("nero za") == ["nero zagori", "nero zagori 1.5lt"]
+
+
+def test_suggest_long_prefix_and_names():
+    suggester = PrefixSuggester(NAMES)
+    # longer than the precomputed prefixes: bisect over the terms
+    assert suggester.complete_term("galak", 5) == ["galaktoboureko"]
+    # a trailing space completes names only
+    assert suggester.suggest("gala ") == ["gala delta 1lt", "gala delta 2lt", "gala olympos 1lt"]
+
+
+def test_suggest_empty_and_unknown():
+    suggester = PrefixSuggester(NAMES)
+    assert suggester.suggest("") == []
+    assert suggester.suggest("   ") == []
+    assert suggester.suggest("qqq") == []
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+from pydantic import ValidationError
+
+from models.watchlist import WatchlistProductsChangeRequest
+from scripts.watchlist_cache import LocalSummaryStore, WatchlistSummaryCache
+
+
+def cached(version: int, watchlists: list) -> WatchlistSummaryCache:
+    cache = WatchlistSummaryCache(LocalSummaryStore())
+    asyncio.run(cache.put(1, version, watchlists))
+    return cache
+
+
+def test_change_products_applies_add_then_remove_like_the_statements():
+    cache = cached(9, [{"id": 10, "name": "weekly", "product_ids": [5]}])
+    asyncio.run(cache.change_products(1, 10, 10, added=[7, 8], removed=[7, 5]))
+    assert asyncio.run(cache.get(1, 10)) == [{"id": 10, "name": "weekly", "product_ids": [8]}]
+
+
+def test_change_request_rejects_ids_both_added_and_removed():
+    with pytest.raises(ValidationError):
+        WatchlistProductsChangeRequest(add=[1, 7], remove=[7])
+    assert WatchlistProductsChangeRequest(add=[1], remove=[7]).remove == [7]
+
+
+def test_write_through_patches_the_next_version():
+    cache = cached(3, [{"id": 10, "name": "weekly", "product_ids": [5]}])
+    asyncio.run(cache.add_watchlist(1, 4, 11, "party"))
+    assert asyncio.run(cache.get(1, 3)) is None
+    assert asyncio.run(cache.get(1, 4)) == [
+        {"id": 10, "name": "weekly", "product_ids": [5]},
+        {"id": 11, "name": "party", "product_ids": []},
+    ]
+    asyncio.run(cache.remove_watchlist(1, 5, 10))
+    assert asyncio.run(cache.get(1, 5)) == [{"id": 11, "name": "party", "product_ids": []}]
+    assert cache.stats()["write_throughs"] == 2
+
+
+def test_write_through_drops_an_entry_that_missed_a_change():
+    cache = cached(3, [])
+    asyncio.run(cache.add_watchlist(1, 5, 11, "party"))  # version 4 was never seen
+    assert asyncio.run(cache.store.get(1)) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_add_watchlist_is_idempotent():
+    # summary cached by a read that already saw the new watchlist, stamped with the version before it
+    cache = cached(3, [{"id": 11, "name": "party", "product_ids": []}])
+    asyncio.run(cache.add_watchlist(1, 4, 11, "party"))
+    assert asyncio.run(cache.get(1, 4)) == [{"id": 11, "name": "party", "product_ids": []}]
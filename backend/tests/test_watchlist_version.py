@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from scripts import helper
+
+
+class UserlessSession:
+    """The UPDATE ... RETURNING of a user deleted through another worker matches no row"""
+
+    def __init__(self):
+        self.added = []
+
+    async def execute(self, statement, params=None):
+        class Result:
+            def scalar_one_or_none(self):
+                return None
+
+        return Result()
+
+    def add(self, instance):
+        self.added.append(instance)
+
+
+def test_bump_for_a_deleted_user_is_a_404():
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(helper.bump_watchlists_version_async(1, UserlessSession()))
+    assert error.value.status_code == 404
+
+
+def test_create_watchlist_for_a_deleted_user_is_a_404_before_the_insert():
+    db = UserlessSession()
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(helper.create_watchlist_for_user_async(1, "weekly", db))
+    assert error.value.status_code == 404
+    assert db.added == []